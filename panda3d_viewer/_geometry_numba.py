@@ -0,0 +1,57 @@
+"""This module contains optional Numba-compiled geometry kernels."""
+
+# pylint: disable=invalid-name
+
+import math
+
+import numpy as np
+from numba import njit
+
+__all__ = ('capsule_buffers',)
+
+
+@njit(cache=True, fastmath=True)
+def capsule_buffers(radius, length, num_segments, num_rings):
+    """Compute capsule vertex rows and triangle indices in a single pass.
+
+    Arguments:
+        radius {float} -- capsule radius
+        length {float} -- capsule length
+        num_segments {int} -- segments number
+        num_rings {int} -- rings number
+
+    Returns:
+        tuple -- (N, 8) float32 rows in v3n3t2 layout, (M, 3) uint32 indices
+    """
+    rows = np.empty((num_rings * num_segments, 8), dtype=np.float32)
+    for i in range(num_rings):
+        u = math.pi * i / (num_rings - 1)
+        su, cu = math.sin(u), math.cos(u)
+        offset = 0.0
+        if cu > 0:
+            offset = 0.5 * length
+        elif cu < 0:
+            offset = -0.5 * length
+        for j in range(num_segments):
+            v = 2 * math.pi * j / (num_segments - 1)
+            x, y = math.cos(v) * su, math.sin(v) * su
+            row = rows[i * num_segments + j]
+            row[0], row[1], row[2] = x * radius, y * radius, cu * radius + offset
+            row[3], row[4], row[5] = x, y, cu
+            row[6], row[7] = u / math.pi, v / (2 * math.pi)
+
+    # skip degenerate triangles touching the poles
+    indices = np.empty((2 * max(num_rings - 2, 0) * (num_segments - 1), 3), dtype=np.uint32)
+    k = 0
+    for i in range(num_rings - 1):
+        for j in range(num_segments - 1):
+            r0 = i * num_segments + j
+            r1 = r0 + num_segments
+            if i < num_rings - 2:
+                indices[k, 0], indices[k, 1], indices[k, 2] = r0, r1, r1 + 1
+                k += 1
+            if i > 0:
+                indices[k, 0], indices[k, 1], indices[k, 2] = r0, r1 + 1, r0 + 1
+                k += 1
+
+    return rows, indices
@@ -2,75 +2,200 @@
 
 # pylint: disable=invalid-name, too-many-locals
 
+import functools
 import itertools
 
 import numpy as np
-from panda3d.core import (Geom, GeomLines, GeomPoints, GeomTriangles,
-                          GeomVertexData, GeomVertexFormat, GeomVertexWriter)
+from panda3d.core import (Geom, GeomEnums, GeomLines, GeomPoints, GeomTriangles,
+                          GeomVertexData, GeomVertexFormat)
 
 from .viewer_errors import ViewerError
 
 __all__ = ('make_axes', 'make_grid', 'make_cylinder', 'make_box', 'make_plane',
            'make_sphere', 'make_points')
 
+# numpy layouts matching GeomVertexFormat.get_v3c4() and get_v3n3t2() rows
+_V3C4 = np.dtype([('vertex', np.float32, 3), ('color', np.uint8, 4)])
+_V3N3T2 = np.dtype([('vertex', np.float32, 3), ('normal', np.float32, 3),
+                    ('texcoord', np.float32, 2)])
 
-def make_axes():
-    """Make an axes geometry.
+# vertex count from which the JIT-compiled capsule kernel pays off
+_JIT_MIN_ROWS = 1024
+
+# unit quad corners and its two triangles
+_QUAD = np.array(((0, 0), (1, 0), (0, 1), (1, 1)), dtype=np.float32)
+_QUAD_INDICES = np.array((0, 1, 2, 2, 1, 3), dtype=np.uint16)
+
+
+def _fill_vdata(vdata, rows):
+    """Upload interleaved rows into the vertex data at once.
+
+    Arguments:
+        vdata {GeomVertexData} -- vertex data with a single array format
+        rows {np.ndarray} -- contiguous array matching the format stride
+    """
+    vdata.modify_array_handle(0).copy_data_from(np.ascontiguousarray(rows))
+
+
+def _set_indices(prim, indices, num_rows):
+    """Upload vertex indices into the primitive at once.
+
+    Arguments:
+        prim {GeomPrimitive} -- primitive to fill
+        indices {np.ndarray} -- vertex indices
+        num_rows {int} -- number of vertices the indices refer to
+    """
+    # 0xffff is reserved as the strip-cut index of 16-bit index buffers
+    if num_rows < 0xffff:
+        index_type, dtype = GeomEnums.NT_uint16, np.uint16
+    else:
+        index_type, dtype = GeomEnums.NT_uint32, np.uint32
+    prim.set_index_type(index_type)
+    prim.modify_vertices().modify_handle().copy_data_from(
+        np.ascontiguousarray(indices, dtype=dtype))
+
+
+def _make_geom(vformat, rows, prim_type, indices=None):
+    """Make a static geometry from prepared buffers.
+
+    Both buffers are uploaded in one shot, copy_data_from sizes the arrays exactly.
+
+    Arguments:
+        vformat {GeomVertexFormat} -- vertex format with a single array
+        rows {np.ndarray} -- vertex rows matching the format
+        prim_type {type} -- primitive type, e.g. GeomTriangles
+
+    Keyword Arguments:
+        indices {np.ndarray} -- vertex indices, use all rows in order if None (default: {None})
 
     Returns:
         Geom -- p3d geometry
     """
-    vformat = GeomVertexFormat.get_v3c4()
     vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
-    vdata.uncleanSetNumRows(6)
-
-    vertex = GeomVertexWriter(vdata, 'vertex')
-    color = GeomVertexWriter(vdata, 'color')
+    _fill_vdata(vdata, rows)
 
-    for x, y, z in np.eye(3):
-        vertex.addData3(0, 0, 0)
-        color.addData4(x, y, z, 1)
-        vertex.addData3(x, y, z)
-        color.addData4(x, y, z, 1)
-
-    prim = GeomLines(Geom.UHStatic)
-    prim.addNextVertices(6)
+    prim = prim_type(Geom.UHStatic)
+    if indices is None:
+        prim.add_next_vertices(len(rows))
+    else:
+        _set_indices(prim, indices, len(rows))
 
     geom = Geom(vdata)
-    geom.addPrimitive(prim)
+    geom.add_primitive(prim)
     return geom
 
 
+def _axes_rows():
+    rows = np.zeros(6, dtype=_V3C4)
+    rows['vertex'][1::2] = np.eye(3, dtype=np.float32)
+    rows['color'][:, :3] = np.repeat(np.eye(3, dtype=np.uint8), 2, axis=0) * 255
+    rows['color'][:, 3] = 255
+    return rows
+
+
+def _box_rows():
+    axes = itertools.permutations(np.eye(3, dtype=np.float32), r=2)
+    x, y = np.array(list(axes)).transpose(1, 0, 2)
+    z = np.cross(x, y)
+    # six faces by four vertices each
+    rows = np.empty((6, 4), dtype=_V3N3T2)
+    u, v = (_QUAD - 0.5).T
+    rows['vertex'] = x[:, None] * u[:, None] + y[:, None] * v[:, None] + z[:, None] * 0.5
+    rows['normal'] = z[:, None]
+    rows['texcoord'] = _QUAD
+    return rows.ravel()
+
+
+def _plane_rows():
+    rows = np.empty(4, dtype=_V3N3T2)
+    rows['vertex'][:, :2] = _QUAD - 0.5
+    rows['vertex'][:, 2] = 0
+    rows['normal'] = (0, 0, 1)
+    rows['texcoord'] = _QUAD
+    return rows
+
+
+@functools.lru_cache(maxsize=None)
+def _capsule_buffers_jit():
+    """Import the optional Numba capsule kernel on first use, None if unavailable."""
+    try:
+        from ._geometry_numba import capsule_buffers
+    except ImportError:
+        return None
+    return capsule_buffers
+
+
+def _capsule_buffers(radius, length, num_segments, num_rings):
+    u = np.linspace(0, np.pi, num_rings, dtype=np.float32)[:, None]
+    v = np.linspace(0, 2 * np.pi, num_segments, dtype=np.float32)[None, :]
+    su, cu, sv, cv = np.sin(u), np.cos(u), np.sin(v), np.cos(v)
+
+    # write every field in place through (rings, segments) views of the rows
+    rows = np.empty(num_rings * num_segments, dtype=_V3N3T2)
+    normal = rows['normal'].reshape(num_rings, num_segments, 3)
+    vertex = rows['vertex'].reshape(num_rings, num_segments, 3)
+    texcoord = rows['texcoord'].reshape(num_rings, num_segments, 2)
+    np.multiply(cv, su, out=normal[..., 0])
+    np.multiply(sv, su, out=normal[..., 1])
+    normal[..., 2] = cu
+    np.multiply(normal, radius, out=vertex)
+    if length:
+        # upper hemisphere rings (including the equator) are shifted up, others down,
+        # decided by the ring index since cos(pi/2) sign is not reliable in float32
+        offset = np.where(2 * np.arange(num_rings) <= num_rings - 1, 0.5, -0.5) * length
+        vertex[..., 2] += offset[:, None]
+    texcoord[..., 0] = u / np.pi
+    texcoord[..., 1] = v / (2 * np.pi)
+
+    i, j = np.meshgrid(np.arange(num_rings - 1), np.arange(num_segments - 1), indexing='ij')
+    r0 = (i * num_segments + j).ravel()
+    r1 = r0 + num_segments
+    # two triangles per quad, skip degenerate ones touching the poles
+    quads = np.stack((r0, r1, r1 + 1, r0, r1 + 1, r0 + 1), axis=-1)
+    valid = np.stack((i < num_rings - 2, i > 0), axis=-1)
+    return rows, quads.reshape(-1, 3)[valid.ravel()]
+
+
+# constant meshes, computed once at import
+_AXES_ROWS = _axes_rows()
+_BOX_ROWS = _box_rows()
+_BOX_INDICES = np.arange(0, 24, 4, dtype=np.uint16)[:, None] + _QUAD_INDICES
+_PLANE_ROWS = _plane_rows()
+
+
+def make_axes():
+    """Make an axes geometry.
+
+    Returns:
+        Geom -- p3d geometry (shared, must not be modified)
+    """
+    return _AXES_GEOM
+
+
 def make_grid(num_ticks=10, step=1.0):
     """Make a grid geometry.
 
     Keyword Arguments:
         step {float} -- step in meters (default: {1.0})
-        num_ticks {int} -- ticks number per axis (default: {5})
+        num_ticks {int} -- ticks number per axis (default: {10})
 
     Returns:
         Geom -- p3d geometry
     """
-    ticks = np.arange(-num_ticks // 2, num_ticks // 2 + 1) * step
+    # integer tick indices keep the grid symmetric for odd numbers of ticks too
+    half = num_ticks // 2
+    ticks = np.arange(-half, half + 1, dtype=np.float32) * step
+    ends = ticks[[0, -1]]
 
-    vformat = GeomVertexFormat.get_v3()
-    vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
-    vdata.uncleanSetNumRows(len(ticks) * 4)
-
-    vertex = GeomVertexWriter(vdata, 'vertex')
+    # each tick makes a line along Y followed by a line along X
+    rows = np.empty((len(ticks), 4, 3), dtype=np.float32)
+    rows[:, :2, 0] = ticks[:, None]
+    rows[:, :2, 1] = ends
+    rows[:, 2:, 0] = ends
+    rows[:, 2:, 1] = ticks[:, None]
+    rows[:, :, 2] = 0
 
-    for t in ticks:
-        vertex.addData3(t, ticks[0], 0)
-        vertex.addData3(t, ticks[-1], 0)
-        vertex.addData3(ticks[0], t, 0)
-        vertex.addData3(ticks[-1], t, 0)
-
-    prim = GeomLines(Geom.UHStatic)
-    prim.addNextVertices(len(ticks) * 4)
-
-    geom = Geom(vdata)
-    geom.addPrimitive(prim)
-    return geom
+    return _make_geom(GeomVertexFormat.get_v3(), rows.reshape(-1, 3), GeomLines)
 
 
 def make_capsule(radius, length, num_segments=16, num_rings=16):
@@ -85,37 +210,21 @@ def make_capsule(radius, length, num_segments=16, num_rings=16):
         num_rings {int} -- rings number (default: {16})
 
     Returns:
-        Geom -- p3d geometry
+        Geom -- p3d geometry (cached, must not be modified)
     """
-    vformat = GeomVertexFormat.get_v3n3t2()
-    vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
-    vdata.uncleanSetNumRows(num_segments * num_rings)
-
-    vertex = GeomVertexWriter(vdata, 'vertex')
-    normal = GeomVertexWriter(vdata, 'normal')
-    tcoord = GeomVertexWriter(vdata, 'texcoord')
-
-    for u in np.linspace(0, np.pi, num_rings):
-        for v in np.linspace(0, 2 * np.pi, num_segments):
-            x, y, z = np.cos(v) * np.sin(u), np.sin(v) * np.sin(u), np.cos(u)
-            offset = np.sign(z) * 0.5 * length
-            vertex.addData3(x * radius, y * radius, z * radius + offset)
-            normal.addData3(x, y, z)
-            tcoord.addData2(u / np.pi, v / (2 * np.pi))
-
-    prim = GeomTriangles(Geom.UHStatic)
-    for i in range(num_rings - 1):
-        for j in range(num_segments - 1):
-            r0 = i * num_segments + j
-            r1 = r0 + num_segments
-            if i < num_rings - 2:
-                prim.addVertices(r0, r1, r1 + 1)
-            if i > 0:
-                prim.addVertices(r0, r1 + 1, r0 + 1)
+    return _capsule_geom(float(radius), float(length), int(num_segments), int(num_rings))
 
-    geom = Geom(vdata)
-    geom.addPrimitive(prim)
-    return geom
+
+@functools.lru_cache(maxsize=128)
+def _capsule_geom(radius, length, num_segments, num_rings):
+    # the kernel needs two rings and segments at least, fewer go down the NumPy path
+    jit = num_segments * num_rings >= _JIT_MIN_ROWS and min(num_segments, num_rings) >= 2
+    if jit and _capsule_buffers_jit() is not None:
+        rows, indices = _capsule_buffers_jit()(radius, length, num_segments, num_rings)
+    else:
+        rows, indices = _capsule_buffers(radius, length, num_segments, num_rings)
+
+    return _make_geom(GeomVertexFormat.get_v3n3t2(), rows, GeomTriangles, indices)
 
 
 def make_cylinder(num_segments=16, closed=True):
@@ -126,89 +235,63 @@ def make_cylinder(num_segments=16, closed=True):
         closed {bool} -- add caps (default: {True})
 
     Returns:
-        Geom -- p3d geometry
+        Geom -- p3d geometry (cached, must not be modified)
     """
-    vformat = GeomVertexFormat.get_v3n3t2()
-    vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
+    return _cylinder_geom(int(num_segments), bool(closed))
+
 
-    vertex = GeomVertexWriter(vdata, 'vertex')
-    normal = GeomVertexWriter(vdata, 'normal')
-    tcoord = GeomVertexWriter(vdata, 'texcoord')
+@functools.lru_cache(maxsize=128)
+def _cylinder_geom(num_segments, closed):
+    phi = np.linspace(0, 2 * np.pi, num_segments, dtype=np.float32)
+    x, y = np.cos(phi), np.sin(phi)
 
     cyl_rows = num_segments * 2
     cap_rows = num_segments + 1
-    if closed:
-        vdata.uncleanSetNumRows(cyl_rows + 2 * cap_rows)
-    else:
-        vdata.uncleanSetNumRows(cyl_rows)
+    rows = np.empty(cyl_rows + 2 * cap_rows if closed else cyl_rows, dtype=_V3N3T2)
+
+    # bottom and top vertices of each segment
+    side = rows[:cyl_rows].reshape(num_segments, 2)
+    side['vertex'][..., 0] = x[:, None]
+    side['vertex'][..., 1] = y[:, None]
+    side['vertex'][..., 2] = (-0.5, 0.5)
+    side['normal'][..., :2] = side['vertex'][..., :2]
+    side['normal'][..., 2] = 0
+    side['texcoord'][..., 0] = phi[:, None] / (2 * np.pi)
+    side['texcoord'][..., 1] = (0, 1)
 
-    for phi in np.linspace(0, 2 * np.pi, num_segments):
-        x, y = np.cos(phi), np.sin(phi)
-        for z in (-1, 1):
-            vertex.addData3(x, y, z * 0.5)
-            normal.addData3(x, y, 0)
-            tcoord.addData2(phi / (2 * np.pi), (z + 1) / 2)
-
-    prim = GeomTriangles(Geom.UHStatic)
-    for i in range(num_segments - 1):
-        prim.addVertices(i * 2, i * 2 + 3, i * 2 + 1)
-        prim.addVertices(i * 2, i * 2 + 2, i * 2 + 3)
+    if closed:
+        # bottom and top caps, each one is a center vertex followed by a ring
+        caps = rows[cyl_rows:].reshape(2, cap_rows)
+        caps['vertex'][:, 0, :2] = 0
+        caps['vertex'][:, 1:, 0] = x
+        caps['vertex'][:, 1:, 1] = y
+        caps['vertex'][..., 2] = ((-0.5,), (0.5,))
+        caps['normal'][..., :2] = 0
+        caps['normal'][..., 2] = ((-1,), (1,))
+        caps['texcoord'][:, 0] = 0
+        caps['texcoord'][:, 1:] = np.stack((x, y), axis=-1)
+
+    i = np.arange(num_segments - 1)[:, None] * 2
+    indices = (i + (0, 3, 1, 0, 2, 3)).reshape(-1, 3)
 
     if closed:
-        for z in (-1, 1):
-            vertex.addData3(0, 0, z * 0.5)
-            normal.addData3(0, 0, z)
-            tcoord.addData2(0, 0)
-
-            for phi in np.linspace(0, 2 * np.pi, num_segments):
-                x, y = np.cos(phi), np.sin(phi)
-                vertex.addData3(x, y, z * 0.5)
-                normal.addData3(0, 0, z)
-                tcoord.addData2(x, y)
-
-        for i in range(num_segments):
-            r0 = cyl_rows
-            r1 = r0 + cap_rows
-            prim.addVertices(r0, r0 + i + 1, r0 + i)
-            prim.addVertices(r1, r1 + i, r1 + i + 1)
+        i = np.arange(num_segments)[:, None]
+        r0 = cyl_rows
+        r1 = r0 + cap_rows
+        caps = np.column_stack((np.full_like(i, r0), r0 + i + 1, r0 + i,
+                                np.full_like(i, r1), r1 + i, r1 + i + 1)).reshape(-1, 3)
+        indices = np.concatenate((indices, caps))
 
-    geom = Geom(vdata)
-    geom.addPrimitive(prim)
-    return geom
+    return _make_geom(GeomVertexFormat.get_v3n3t2(), rows, GeomTriangles, indices)
 
 
 def make_box():
     """Make a uniform box geometry.
 
     Returns:
-        Geom -- p3d geometry
+        Geom -- p3d geometry (shared, must not be modified)
     """
-    vformat = GeomVertexFormat.get_v3n3t2()
-    vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
-    vdata.uncleanSetNumRows(24)
-
-    vertex = GeomVertexWriter(vdata, 'vertex')
-    normal = GeomVertexWriter(vdata, 'normal')
-    tcoord = GeomVertexWriter(vdata, 'texcoord')
-
-    axes = itertools.permutations(np.eye(3), r=2)
-    quad = ((0, 0), (1, 0), (0, 1), (1, 1))
-
-    for x, y in axes:
-        z = np.cross(x, y)
-        for u, v in quad:
-            vertex.addData3(*(x * (u - 0.5) + y * (v - 0.5) + z * 0.5))
-            normal.addData3(*z)
-            tcoord.addData2(u, v)
-
-    prim = GeomTriangles(Geom.UHStatic)
-    for i in range(0, 24, 4):
-        prim.addVertices(i + 0, i + 1, i + 2)
-        prim.addVertices(i + 2, i + 1, i + 3)
-
-    geom = Geom(vdata)
-    geom.addPrimitive(prim)
-    return geom
+    return _BOX_GEOM
 
 
 def make_plane(size=(1.0, 1.0)):
@@ -218,30 +301,21 @@ def make_plane(size=(1.0, 1.0)):
         size {tuple} -- plane size x,y
 
     Returns:
-        Geom -- p3d geometry
+        Geom -- p3d geometry (cached, must not be modified)
     """
-    vformat = GeomVertexFormat.get_v3n3t2()
-    vdata = GeomVertexData('vdata', vformat, Geom.UHStatic)
-    vdata.uncleanSetNumRows(4)
-
-    vertex = GeomVertexWriter(vdata, 'vertex')
-    normal = GeomVertexWriter(vdata, 'normal')
-    tcoord = GeomVertexWriter(vdata, 'texcoord')
+    # any sequence of two numbers, normalized to a hashable cache key
+    return _plane_geom(tuple(map(float, size)))
 
-    quad = ((0, 0), (1, 0), (0, 1), (1, 1))
 
-    for u, v in quad:
-        vertex.addData3((u - 0.5) * size[0], (v - 0.5) * size[1], 0)
-        normal.addData3(0, 0, 1)
-        tcoord.addData2(u, v)
+@functools.lru_cache(maxsize=128)
+def _plane_geom(size):
+    if size == (1.0, 1.0):
+        return _PLANE_UNIT_GEOM
 
-    prim = GeomTriangles(Geom.UHStatic)
-    prim.addVertices(0, 1, 2)
-    prim.addVertices(2, 1, 3)
+    rows = _PLANE_ROWS.copy()
+    rows['vertex'][:, :2] *= size
 
-    geom = Geom(vdata)
-    geom.addPrimitive(prim)
-    return geom
+    return _make_geom(GeomVertexFormat.get_v3n3t2(), rows, GeomTriangles, _QUAD_INDICES)
 
 
 def make_sphere(num_segments=16, num_rings=16):
@@ -252,7 +326,7 @@ def make_sphere(num_segments=16, num_rings=16):
         num_rings {int} -- rings number (default: {16})
 
     Returns:
-        Geom -- p3d geometry
+        Geom -- p3d geometry (cached, must not be modified)
     """
     return make_capsule(1.0, 0.0, num_segments, num_rings)
 
@@ -292,8 +366,6 @@ def make_points(vertices, colors=None, texture_coords=None, geom=None):
             vertices.view(dtype=np.uint32).reshape(-1, 3),
             texture_coords.view(dtype=np.uint32).reshape(-1, 2)))
 
-    data = vertices.tostring()
-
     if geom is None:
         if vertices.strides[0] == 12:
             vformat = GeomVertexFormat.get_v3()
@@ -306,8 +378,7 @@ def make_points(vertices, colors=None, texture_coords=None, geom=None):
                 vertices.dtype, vertices.shape))
 
         vdata = GeomVertexData('vdata', vformat, Geom.UHDynamic)
-        vdata.unclean_set_num_rows(len(vertices))
-        vdata.modify_array_handle(0).set_subdata(0, len(data), data)
+        _fill_vdata(vdata, vertices)
 
         prim = GeomPoints(Geom.UHDynamic)
         prim.clear_vertices()
@@ -318,8 +389,7 @@ def make_points(vertices, colors=None, texture_coords=None, geom=None):
         geom.add_primitive(prim)
     else:
         vdata = geom.modify_vertex_data()
-        vdata.unclean_set_num_rows(len(vertices))
-        vdata.modify_array_handle(0).set_subdata(0, len(data), data)
+        _fill_vdata(vdata, vertices)
 
         prim = geom.modify_primitive(0)
         prim.clear_vertices()
@@ -327,3 +397,10 @@ def make_points(vertices, colors=None, texture_coords=None, geom=None):
         prim.close_primitive()
 
     return geom
+
+
+# constant geometries, shared by all nodes
+_AXES_GEOM = _make_geom(GeomVertexFormat.get_v3c4(), _AXES_ROWS, GeomLines)
+_BOX_GEOM = _make_geom(GeomVertexFormat.get_v3n3t2(), _BOX_ROWS, GeomTriangles, _BOX_INDICES)
+_PLANE_UNIT_GEOM = _make_geom(
+    GeomVertexFormat.get_v3n3t2(), _PLANE_ROWS, GeomTriangles, _QUAD_INDICES)
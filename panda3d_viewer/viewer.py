@@ -1,5 +1,7 @@
 """This module contains Viewer, a simpe and efficient cross-platform 3D viewer."""
 
+from contextlib import contextmanager
+
 from .viewer_config import ViewerConfig
 from .viewer_errors import ViewerError, ViewerClosedError
 
@@ -52,7 +54,23 @@ class Viewer:
         if self._window_type == 'offscreen':
             self._app.destroy()
 
-    def append_group(self, root_path, remove_if_exists=True, scale=1.0):
+    @contextmanager
+    def batch(self):
+        """Send the calls made within a with-block to the viewer at once.
+
+        An onscreen viewer runs in a sub-process, where a batch saves a round-trip per call,
+        a call made outside of a batch waits for the viewer and raises its own error.
+        A failed call stops the batch, the calls after it are not run and a ViewerError
+        naming it is raised on exit. Screenshots can not be taken within a batch.
+        An offscreen viewer executes calls at once.
+        """
+        if self._window_type == 'onscreen':
+            with self._app.batch():
+                yield
+        else:
+            yield
+
+    def append_group(self, root_path, remove_if_exists=True, scale=1.0, static=False):
         """Append a root node for a group of nodes.
 
         Arguments:
@@ -61,8 +79,9 @@ class Viewer:
         Keyword Arguments:
             remove_if_exists {bool} -- remove group with root_path if exists (default: {True})
             scale {float} -- scale factor for nodes dimensions and positions (default: {1.0})
+            static {bool} -- cull the group as a whole by its bounding box (default: {False})
         """
-        self._app.append_group(root_path, remove_if_exists, scale)
+        self._app.append_group(root_path, remove_if_exists, scale, static)
 
     def remove_group(self, root_path):
         """Remove a group of nodes.
@@ -90,6 +109,19 @@ class Viewer:
         """
         self._app.move_nodes(root_path, name_pose_dict)
 
+    def move_nodes_bulk(self, root_path, names, poses):
+        """Set a pose for nodes within a group from a poses array.
+
+        Cheaper than move_nodes when animating many nodes every frame.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            names {list} -- node names within a group
+            poses {np.ndarray} -- (N, 7) array of positions and quaternions (x, y, z, w, i, j, k)
+                                  or (N, 4, 4) array of transformation matrices
+        """
+        self._app.move_nodes_bulk(root_path, names, poses)
+
     def append_mesh(self, root_path, name, mesh_path, scale=None, frame=None, no_cache=None):
         """Append a mesh node to the group.
 
@@ -185,6 +217,19 @@ class Viewer:
         """
         self._app.append_cloud(root_path, name, thickness, frame)
 
+    def append_nodes(self, root_path, nodes_spec):
+        """Append several nodes to the group at once.
+
+        In onscreen mode the whole list is sent to the viewer process in one message.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            nodes_spec {list} -- [(kind, name, params, frame)] list, where kind is one of
+                                 mesh, capsule, cylinder, box, plane, sphere, cloud and
+                                 params is a tuple of the append_<kind> positional arguments
+        """
+        self._app.append_nodes(root_path, list(nodes_spec))
+
     def set_cloud_data(self, root_path, name, vertices, colors=None,
                        texture_coords=None, texture_image=None):
         """Update existing point cloud.
@@ -197,7 +242,7 @@ class Viewer:
         Keyword Arguments:
             colors {list} -- optional colors (default: {None})
             texture_coords {list} -- optional texture coordinates (default: {None})
-            texture_image {np.ndarray} -- texture image (default: {None})
+            texture_image {np.ndarray} -- grey, grey-alpha, BGR or BGRA image (default: {None})
         """
         self._app.set_cloud_data(root_path, name, vertices, colors, texture_coords, texture_image)
 
@@ -223,6 +268,21 @@ class Viewer:
         """
         self._app.set_materials(root_path, name_material_dict)
 
+    def set_materials_bulk(self, root_path, names, colors, texture_paths=None):
+        """Override material of nodes within a group from a colors array.
+
+        Cheaper than set_materials when recoloring many nodes every frame.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            names {list} -- node names within a group
+            colors {np.ndarray} -- (N, 4) array of colors RGBA
+
+        Keyword Arguments:
+            texture_paths {list} -- paths to the texture files on disk (default: {None})
+        """
+        self._app.set_materials_bulk(root_path, names, colors, texture_paths)
+
     def reset_camera(self, pos, look_at):
         """Reset camera position.
 
@@ -305,29 +365,44 @@ class Viewer:
         """
         self._app.set_background_color(color_rgb)
 
-    def save_screenshot(self, filename=None):
+    def save_screenshot(self, filename=None, blocking=True):
         """Capture a screenshot from the main window and write image to disk.
 
         Keyword Arguments:
             filename {str} -- filename (including extension) to save image (default: {auto})
+            blocking {bool} -- wait for the file to be written (default: {True})
 
         Returns:
-            bool -- success flag
+            bool -- success flag, the capture one only if not blocking
         """
         self._app.step()  # render
-        return self._app.save_screenshot(filename)
+        return self._app.save_screenshot(filename, blocking)
 
-    def get_screenshot(self, requested_format='BGRA'):
+    def get_screenshot(self, requested_format='BGRA', copy=False):
         """Capture and return a screenshot from offscreen buffer.
 
         Keyword Arguments:
             requested_format {str} -- image channels, e.g. RGB, BGR (default: {'BGRA'})
+            copy {bool} -- return a C-contiguous copy instead of a flipped view (default: {False})
 
         Returns:
             ndarray -- image as uint8 numpy array (height, width, num_channels)
         """
         self._app.step()  # render
-        return self._app.get_screenshot(requested_format)
+        return self._app.get_screenshot(requested_format, copy)
+
+    def get_screenshot_async(self, requested_format='BGRA'):
+        """Request a screenshot of the next rendered frame (offscreen only).
+
+        Keyword Arguments:
+            requested_format {str} -- image channels, e.g. RGB, BGR (default: {'BGRA'})
+
+        Returns:
+            ScreenshotFuture -- pending screenshot, result() returns the image
+        """
+        if self._window_type != 'offscreen':
+            raise ViewerError('Asynchronous screenshots require an offscreen window')
+        return self._app.get_screenshot_async(requested_format)
 
     def __enter__(self):
         """Enter the viewer context."""
@@ -4,30 +4,201 @@ ViewerApp responsible for opening a graphical display,
 setting up input devices and creating the scene graph.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import math
 import numpy as np
 
 from panda3d.core import Vec3, Vec4, Quat, Mat4, BitMask32
-from panda3d.core import GeomNode, TextNode, NodePath
+from panda3d.core import GeomNode, TextNode, NodePath, PandaNode, TransformState
+from panda3d.core import Datagram, DatagramIterator, Filename, LoaderOptions
 from panda3d.core import AmbientLight, DirectionalLight, Spotlight
 from panda3d.core import Material, Texture
 from panda3d.core import AntialiasAttrib, CullFaceAttrib, TransparencyAttrib, LightRampAttrib
-from panda3d.core import PNMImage, Fog
+from panda3d.core import LightAttrib
+from panda3d.core import PNMImage, Fog, BoundingVolume
+from panda3d.core import ClockObject, GraphicsOutput
 from panda3d.core import loadPrcFileData
 
 from direct.showbase.ShowBase import ShowBase
 from direct.gui.OnscreenText import OnscreenText
 
 from . import geometry
+from .viewer_errors import ViewerError
 
 __all__ = ('ViewerApp')
 
+_UNIT_SCALE = Vec3(1, 1, 1)
+_REVERSE_CULL = CullFaceAttrib.make_reverse()
+# cloud texture layouts by the number of image channels, {channels : (image format, format)},
+# the image formats match the texture RAM layout, so no reformat is needed
+_CLOUD_TEXTURE_FORMATS = {
+    1: ('G', Texture.F_luminance),
+    2: ('GA', Texture.F_luminance_alpha),
+    3: ('BGR', Texture.F_rgb),
+    4: ('BGRA', Texture.F_rgba),
+}
+
+# scene lights: ambient color, then color and position of the directional lights
+_AMBIENT_LIGHT_COLOR = Vec3(0.2, 0.2, 0.2)
+_DIRECT_LIGHTS = (
+    (Vec3(0.6, 0.8, 0.8), (8.0, 8.0, 10.0)),
+    (Vec3(0.8, 0.6, 0.8), (8.0, -8.0, 10.0)),
+    (Vec3(0.8, 0.8, 0.6), (-8.0, 8.0, 10.0)),
+    (Vec3(0.6, 0.6, 0.8), (-8.0, -8.0, 10.0)),
+)
+
+
+def _help_section(title, items):
+    """Format a titled list of (description, keys) pairs for the help label."""
+    return '{}:\n'.format(title) + \
+        '\n'.join((' {}:\t{}'.format(h, k) for h, k in items))
+
+
+_HELP_TEXT = '\n\n'.join((
+    _help_section("Keyboard shortcuts", (
+        ("Show help", "F1, h"),
+        ("Quit window", "Escape, q"),
+        ("Screenshot", "Space"),
+        ("Toggle axes", "a"),
+        ("Toggle HDR", "d"),
+        ("Toggle grid", "g"),
+        ("Toggle fps meter", "f"),
+        ("Toggle lighting", "l"),
+        ("Toggle fog", "o"),
+        ("Toggle plane", "p"),
+        ("Reset camera", "r"),
+        ("Toggle shadows", "s"),
+        ("Toggle texture", "t"),
+        ("Toggle wireframe", "w"),
+    )),
+    _help_section("Mouse control", (
+        ("Move", "LMB"),
+        ("Scale", "RMB, Ctrl+LMB"),
+        ("Rotate", "LMB+RMB, Alt+LMB"),
+        ("Tilt", "Alt+Ctrl+LMB")
+    ))
+))
+
+
+def _mat_to_quat(mat):
+    """Extract a rotation quaternion from a homogeneous matrix (Shepperd's method).
+
+    Arguments:
+        mat {np.ndarray} -- 4x4 or 3x3 rotation matrix (column vectors)
+
+    Returns:
+        tuple -- quaternion (w, i, j, k)
+    """
+    (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = mat[:3, :3].tolist()
+    trace = m00 + m11 + m22
+    # branch on the largest of the trace and diagonal for numerical stability
+    if trace >= max(m00, m11, m22):
+        s = 2.0 * math.sqrt(1.0 + trace)
+        return (0.25 * s, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s)
+    if m00 >= m11 and m00 >= m22:
+        s = 2.0 * math.sqrt(1.0 + m00 - m11 - m22)
+        return ((m21 - m12) / s, 0.25 * s, (m01 + m10) / s, (m02 + m20) / s)
+    if m11 >= m22:
+        s = 2.0 * math.sqrt(1.0 + m11 - m00 - m22)
+        return ((m02 - m20) / s, (m01 + m10) / s, 0.25 * s, (m12 + m21) / s)
+    s = 2.0 * math.sqrt(1.0 + m22 - m00 - m11)
+    return ((m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, 0.25 * s)
+
+
+def _make_template(name, geom):
+    """Wrap a shared geometry into a node to be instanced by primitive nodes."""
+    geom_node = GeomNode(name)
+    geom_node.add_geom(geom)
+    return NodePath(geom_node)
+
+
+def _read_config(config):
+    """Read all viewer settings from the loaded configuration in one pass.
+
+    Arguments:
+        config {DConfig} -- Panda3D configuration
+
+    Returns:
+        dict -- {setting_name : value} dictionary
+    """
+    return {
+        'enable-antialias': config.GetBool('enable-antialias', False),
+        'enable-spotlight': config.GetBool('enable-spotlight', False),
+        'shadow-buffer-size': config.GetInt('shadow-buffer-size', 1024),
+        'enable-lights': config.GetBool('enable-lights', True),
+        'enable-shadow': config.GetBool('enable-shadow', False),
+        'enable-hdr': config.GetBool('enable-hdr', False),
+        'enable-fog': config.GetBool('enable-fog', False),
+        'show-axes': config.GetBool('show-axes', True),
+        'show-grid': config.GetBool('show-grid', True),
+        'show-floor': config.GetBool('show-floor', False),
+        'scene-scale': config.GetFloat('scene-scale', 1.0),
+        'trackball-scale': config.GetFloat('trackball-scale', 0.01),
+    }
+
+
+def _texture_image(texture, requested_format):
+    """Return a texture RAM image as a top-down (height, width, num_channels) view."""
+    xsize = texture.get_x_size()
+    ysize = texture.get_y_size()
+    dsize = len(requested_format)
+    image = texture.get_ram_image_as(requested_format)
+    array = np.frombuffer(memoryview(image), dtype=np.uint8)
+    return array.reshape((ysize, xsize, dsize))[::-1]
+
+
+class ScreenshotFuture:
+    """A screenshot of a frame which is not rendered yet."""
+
+    def __init__(self, app, texture, requested_format):
+        """Remember the frame to capture.
+
+        Arguments:
+            app {ViewerApp} -- application rendering the frame
+            texture {Texture} -- texture receiving the frame copy
+            requested_format {str} -- image channels, e.g. RGB, BGR
+        """
+        self._app = app
+        self._texture = texture
+        self._format = requested_format
+        self._frame = ClockObject.get_global_clock().get_frame_count()
+
+    def done(self):
+        """Check the frame has been rendered.
+
+        Returns:
+            bool -- flag
+        """
+        return ClockObject.get_global_clock().get_frame_count() > self._frame
+
+    def result(self, out=None):
+        """Return the screenshot, render the frame first if needed.
+
+        The image stays available until the next screenshot request.
+
+        Keyword Arguments:
+            out {ndarray} -- preallocated uint8 array to copy the image into (default: {None})
+
+        Returns:
+            ndarray -- image as uint8 numpy array (height, width, num_channels)
+        """
+        if not self.done():
+            self._app.step()
+        array = _texture_image(self._texture, self._format)
+        if out is None:
+            return np.ascontiguousarray(array)
+        np.copyto(out, array)
+        return out
+
 
 class ViewerApp(ShowBase):
     """A Panda3D based application."""
 
     LightMask = BitMask32(1)
 
+    NodeKinds = ('mesh', 'capsule', 'cylinder', 'box', 'plane', 'sphere', 'cloud')
+
     def __init__(self, config):
         """Open a window, setup a scene.
 
@@ -39,51 +210,69 @@ class ViewerApp(ShowBase):
 
         ShowBase.__init__(self)
 
+        self._cfg = _read_config(self.config)
+
         self.render.set_shader_auto()
-        self.render.set_antialias(AntialiasAttrib.MAuto)
+        if self._cfg['enable-antialias']:
+            # opt-in, it is a significant performance drop on some GPUs
+            self.render.set_antialias(AntialiasAttrib.MAuto)
 
         self._camera_defaults = [(4.0, -4.0, 1.5), (0, 0, 0.5)]
         self.reset_camera(*self._camera_defaults)
 
-        self._spotlight = self.config.GetBool('enable-spotlight', False)
-        self._shadow_size = self.config.GetInt('shadow-buffer-size', 1024)
-        self._lights = [
-            self._make_light_ambient((0.2, 0.2, 0.2)),
-            self._make_light_direct(
-                1, (0.6, 0.8, 0.8), pos=(8.0, 8.0, 10.0)),
-            self._make_light_direct(
-                2, (0.8, 0.6, 0.8), pos=(8.0, -8.0, 10.0)),
-            self._make_light_direct(
-                3, (0.8, 0.8, 0.6), pos=(-8.0, 8.0, 10.0)),
-            self._make_light_direct(
-                4, (0.6, 0.6, 0.8), pos=(-8.0, -8.0, 10.0)),
-        ]
+        self._spotlight = self._cfg['enable-spotlight']
+        self._shadow_size = self._cfg['shadow-buffer-size']
+        self._lights = [self._make_light_ambient(_AMBIENT_LIGHT_COLOR)]
+        for index, (color, pos) in enumerate(_DIRECT_LIGHTS, 1):
+            self._lights.append(self._make_light_direct(index, color, pos=pos))
         self._lights_mask = [True, True, True, False, False]
-        self.enable_lights(self.config.GetBool('enable-lights', True))
-        self.enable_shadow(self.config.GetBool('enable-shadow', False))
-        self.enable_hdr(self.config.GetBool('enable-hdr', False))
+        self._lights_applied = None
+        self.enable_lights(self._cfg['enable-lights'])
+        self.enable_shadow(self._cfg['enable-shadow'])
+        self.enable_hdr(self._cfg['enable-hdr'])
+
+        # helpers are created on first use
+        self._fog = None
+        self._fog_enabled = False
+        self.enable_fog(self._cfg['enable-fog'])
 
-        self._fog = self._make_fog()
-        self.enable_fog(self.config.GetBool('enable-fog', False))
+        # static scene helpers share one parent
+        self._helpers = self.render.attach_new_node('helpers')
 
-        self._axes = self._make_axes()
-        self.show_axes(self.config.GetBool('show-axes', True))
+        self._axes = None
+        self._axes_shown = False
+        self.show_axes(self._cfg['show-axes'])
 
-        self._grid = self._make_grid()
-        self.show_grid(self.config.GetBool('show-grid', True))
+        self._grid = None
+        self._grid_shown = False
+        self.show_grid(self._cfg['show-grid'])
 
-        self._floor = self._make_floor()
-        self.show_floor(self.config.GetBool('show-floor', False))
+        self._floor = None
+        self._floor_shown = False
+        self.show_floor(self._cfg['show-floor'])
 
         self._scene_root = self.render.attach_new_node('scene_root')
-        self._scene_scale = self.config.GetFloat('scene-scale', 1.0)
+        self._scene_root.node().set_bounds_type(BoundingVolume.BT_box)
+        self._scene_scale = self._cfg['scene-scale']
         self._scene_root.set_scale(self._scene_scale)
         self._groups = {}
+        self._group_parents = {}
+        self._group_nodes = {}
+        self._group_poses = {}
+        self._group_colors = {}
+        self._materials = {}
+        self._textures = {}
+        self._meshes = {}
+        # primitive nodes instanced by appended nodes, {(kind, *make_args) : NodePath}
+        self._templates = {}
+        # point cloud nodes with the render attributes set up, {thickness : NodePath}
+        self._cloud_protos = {}
+        self._screenshot_texture = None
+        self._image_writer = None
 
         if self.windowType == 'onscreen':
             self._help_label = None
-            self.trackball.node().set_forward_scale(
-                self.config.GetFloat('trackball-scale', 0.01))
+            self.trackball.node().set_forward_scale(self._cfg['trackball-scale'])
             self._setup_shortcuts()
 
     def step(self):
@@ -100,12 +289,21 @@ class ViewerApp(ShowBase):
         Interrupts the application loop (run() function)
         """
         self.task_mgr.stop()
+        self._flush_image_writer()
+
+    def destroy(self):
+        """Wait for pending screenshot writes and release all resources."""
+        self._flush_image_writer()
+        self._meshes.clear()
+        self._templates.clear()
+        self._cloud_protos.clear()
+        ShowBase.destroy(self)
 
     def userExit(self):
         """User closed the main window."""
         self.stop()
 
-    def append_group(self, root_path, remove_if_exists=True, scale=1.0):
+    def append_group(self, root_path, remove_if_exists=True, scale=1.0, static=False):
         """Append a root node for a group of nodes.
 
         Arguments:
@@ -114,16 +312,31 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             remove_if_exists {bool} -- remove group with root_path if exists (default: {True})
             scale {float} -- scale factor for nodes dimensions and positions (default: {1.0})
+            static {bool} -- cull the group as a whole by its bounding box (default: {False})
         """
         if remove_if_exists and root_path in self._groups:
             self.remove_group(root_path)
 
+        # share intermediate nodes between groups with a common path prefix
         root = self._scene_root
-        for name in root_path.split('/'):
-            root = root.attach_new_node(name)
+        parts = root_path.split('/')
+        for depth in range(1, len(parts)):
+            prefix = '/'.join(parts[:depth])
+            parent = self._group_parents.get(prefix)
+            if parent is None:
+                parent = root.attach_new_node(parts[depth - 1])
+                self._group_parents[prefix] = parent
+            root = parent
+        root = root.attach_new_node(parts[-1])
+        root.node().set_bounds_type(BoundingVolume.BT_box)
+        if static:
+            root.node().set_final(True)
 
         root.set_scale(Vec3(scale, scale, scale))
         self._groups[root_path] = root
+        self._group_nodes[root_path] = {}
+        self._group_poses[root_path] = {}
+        self._group_colors[root_path] = {}
 
     def remove_group(self, root_path):
         """Remove a group of nodes.
@@ -132,6 +345,24 @@ class ViewerApp(ShowBase):
             root_path {str} -- path to the group's root node
         """
         self._groups.pop(root_path).removeNode()
+        del self._group_nodes[root_path]
+        del self._group_poses[root_path]
+        del self._group_colors[root_path]
+
+        # drop the cached meshes no node instances anymore
+        for mesh_path, model in list(self._meshes.items()):
+            if not model.node().get_num_parents():
+                del self._meshes[mesh_path]
+
+        # drop intermediate nodes left empty
+        parts = root_path.split('/')
+        for depth in range(len(parts) - 1, 0, -1):
+            prefix = '/'.join(parts[:depth])
+            parent = self._group_parents[prefix]
+            if parent.get_num_children():
+                break
+            parent.remove_node()
+            del self._group_parents[prefix]
 
     def show_group(self, root_path, show):
         """Turn a node group rendering on or off.
@@ -153,16 +384,67 @@ class ViewerApp(ShowBase):
             root_path {str} -- path to the group's root node
             name_pose_dict {dict} -- {node_name : (pos, quat) | mat44} dictionary
         """
-        root = self._groups[root_path]
-        for node in root.getChildren():
-            if node.name in name_pose_dict:
-                frame = name_pose_dict[node.name]
-                if isinstance(frame, np.ndarray):
-                    mat = frame.T.flatten()
-                    node.set_mat(Mat4(*mat))
-                else:
-                    pos, quat = frame
-                    node.set_pos_quat(Vec3(*pos), Quat(*quat))
+        nodes = self._group_nodes[root_path]
+        last_poses = self._group_poses[root_path]
+        mat_nodes, mat_frames = [], []
+        for name, frame in name_pose_dict.items():
+            holders = nodes.get(name)
+            if holders is None:
+                continue
+            if isinstance(frame, np.ndarray):
+                # matrices are converted together below
+                for node in holders:
+                    mat_nodes.append(node)
+                    mat_frames.append(frame)
+                last_poses.pop(name, None)
+            else:
+                pos, quat = frame
+                pose = tuple(pos) + tuple(quat)
+                if last_poses.get(name) != pose:
+                    # skip the transform update for nodes which did not move
+                    last_poses[name] = pose
+                    transform = TransformState.make_pos_quat_scale(
+                        Vec3(*pos), Quat(*quat), _UNIT_SCALE)
+                    for node in holders:
+                        node.node().set_transform(transform)
+        if mat_nodes:
+            self._set_matrices(mat_nodes, mat_frames)
+
+    def move_nodes_bulk(self, root_path, names, poses):
+        """Set a pose for nodes within a group from a poses array.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            names {list} -- node names within a group
+            poses {np.ndarray} -- (N, 7) array of positions and quaternions (x, y, z, w, i, j, k)
+                                  or (N, 4, 4) array of transformation matrices
+        """
+        poses = np.asarray(poses, dtype=np.float32)
+        if poses.shape not in ((len(names), 7), (len(names), 4, 4)):
+            raise ViewerError('Poses array shape {} does not match {} nodes'.format(
+                poses.shape, len(names)))
+        nodes = self._group_nodes[root_path]
+        last_poses = self._group_poses[root_path]
+        if poses.ndim == 3:
+            known = [(node, mat) for name, mat in zip(names, poses)
+                     for node in nodes.get(name, ())]
+            for name in names:
+                last_poses.pop(name, None)
+            if known:
+                self._set_matrices(*zip(*known))
+            return
+        for name, pose in zip(names, poses.tolist()):
+            holders = nodes.get(name)
+            if holders is None:
+                continue
+            pose = tuple(pose)
+            if last_poses.get(name) != pose:
+                last_poses[name] = pose
+                x, y, z, w, i, j, k = pose
+                transform = TransformState.make_pos_quat_scale(
+                    Vec3(x, y, z), Quat(w, i, j, k), _UNIT_SCALE)
+                for node in holders:
+                    node.node().set_transform(transform)
 
     def append_node(self, root_path, name, node, frame=None):
         """Append a node to the group.
@@ -176,12 +458,21 @@ class ViewerApp(ShowBase):
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
         root = self._groups[root_path]
-        node.reparent_to(root.attach_new_node(name))
+        holder = root.attach_new_node(name)
+        holders = self._group_nodes[root_path].get(name)
+        if holders is None:
+            self._group_nodes[root_path][name] = [holder]
+        else:
+            # nodes sharing a name are moved and colored together, forget the state
+            # the new node does not have yet
+            holders.append(holder)
+            self._group_poses[root_path].pop(name, None)
+            self._group_colors[root_path].pop(name, None)
+        node.reparent_to(holder)
         if frame is not None:
             if isinstance(frame, np.ndarray):
                 pos = frame[:3, 3]
-                quat = Quat()
-                quat.set_from_matrix(Mat4(*frame.T.flatten()))
+                quat = _mat_to_quat(frame)
             else:
                 pos, quat = frame
             node.set_pos_quat(Vec3(*pos), Quat(*quat).multiply(node.get_quat()))
@@ -199,15 +490,22 @@ class ViewerApp(ShowBase):
             frame {tuple} -- local frame position and quaternion (default: {None})
             no_cache {bool} -- use cache to load a model (default: {None})
         """
-        mesh = self.loader.loadModel(mesh_path, noCache=no_cache)
+        model = self._meshes.get(mesh_path)
+        if model is None or no_cache:
+            model = self._load_model(mesh_path, no_cache)
+            if not no_cache:
+                self._meshes[mesh_path] = model
+        # every node instances the loaded model and keeps its own transform
+        mesh = NodePath(PandaNode('mesh'))
+        model.instance_to(mesh)
         if mesh_path.lower().endswith('.dae'):
             # converting from Y-up to Z-up axes when import from dae
             mesh.set_mat(Mat4.yToZUpMat())
         if scale is not None:
             mesh.set_scale(Vec3(*scale))
-            if sum([s < 0 for s in scale]) % 2 != 0:
-                # reverse the cull order in case of negative scale values
-                mesh.set_attrib(CullFaceAttrib.make_reverse())
+            if (scale[0] < 0) ^ (scale[1] < 0) ^ (scale[2] < 0):
+                # reverse the cull order in case of an odd number of negative scale values
+                mesh.set_attrib(_REVERSE_CULL)
         self.append_node(root_path, name, mesh, frame)
 
     def append_capsule(self, root_path, name, radius, length, frame=None):
@@ -222,10 +520,9 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('capsule')
-        geom_node.add_geom(geometry.make_capsule(radius, length))
-        node = NodePath(geom_node)
-        self.append_node(root_path, name, node, frame)
+        # capsules can not be scaled from a unit one, share them by rounded dimensions
+        key = ('capsule', round(radius, 4), round(length, 4))
+        self._append_primitive(root_path, name, key, None, frame)
 
     def append_cylinder(self, root_path, name, radius, length, frame=None):
         """Append a cylinder primitive node to the group.
@@ -239,11 +536,8 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('cylinder')
-        geom_node.add_geom(geometry.make_cylinder())
-        node = NodePath(geom_node)
-        node.set_scale(Vec3(radius, radius, length))
-        self.append_node(root_path, name, node, frame)
+        self._append_primitive(
+            root_path, name, ('cylinder',), Vec3(radius, radius, length), frame)
 
     def append_box(self, root_path, name, size, frame=None):
         """Append a box primitive node to the group.
@@ -256,11 +550,7 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('box')
-        geom_node.add_geom(geometry.make_box())
-        node = NodePath(geom_node)
-        node.set_scale(Vec3(*size))
-        self.append_node(root_path, name, node, frame)
+        self._append_primitive(root_path, name, ('box',), Vec3(*size), frame)
 
     def append_plane(self, root_path, name, size, frame=None):
         """Append a plane primitive node to the group.
@@ -273,11 +563,8 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('plane')
-        geom_node.add_geom(geometry.make_plane())
-        node = NodePath(geom_node)
-        node.set_scale(Vec3(size[0], size[1], 1.0))
-        self.append_node(root_path, name, node, frame)
+        self._append_primitive(
+            root_path, name, ('plane',), Vec3(size[0], size[1], 1.0), frame)
 
     def append_sphere(self, root_path, name, radius, frame=None):
         """Append a sphere primitive node to the group.
@@ -290,11 +577,8 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('sphere')
-        geom_node.add_geom(geometry.make_sphere())
-        node = NodePath(geom_node)
-        node.set_scale(Vec3(radius, radius, radius))
-        self.append_node(root_path, name, node, frame)
+        self._append_primitive(
+            root_path, name, ('sphere',), Vec3(radius, radius, radius), frame)
 
     def append_cloud(self, root_path, name, thickness=1, frame=None):
         """Append a point cloud node to the group.
@@ -307,14 +591,32 @@ class ViewerApp(ShowBase):
             thickness {int} -- points thickness (default: {1})
             frame {tuple} -- local frame position and quaternion (default: {None})
         """
-        geom_node = GeomNode('cloud')
-        node = NodePath(geom_node)
-        node.set_light_off()
-        node.set_render_mode_wireframe()
-        node.set_render_mode_thickness(thickness)
-        node.set_antialias(AntialiasAttrib.MPoint)
-        node.hide(self.LightMask)
-        self.append_node(root_path, name, node, frame)
+        proto = self._cloud_protos.get(thickness)
+        if proto is None:
+            proto = NodePath(GeomNode('cloud'))
+            proto.set_light_off()
+            proto.set_render_mode_wireframe()
+            proto.set_render_mode_thickness(thickness)
+            proto.set_antialias(AntialiasAttrib.MPoint)
+            proto.hide(self.LightMask)
+            self._cloud_protos[thickness] = proto
+        # each cloud gets its own geometry node, the render state is shared
+        self.append_node(root_path, name, proto.copy_to(NodePath()), frame)
+
+    def append_nodes(self, root_path, nodes_spec):
+        """Append several nodes to the group at once.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            nodes_spec {list} -- [(kind, name, params, frame)] list, where kind is one of
+                                 mesh, capsule, cylinder, box, plane, sphere, cloud and
+                                 params is a tuple of the append_<kind> positional arguments
+        """
+        for kind, name, params, frame in nodes_spec:
+            if kind not in self.NodeKinds:
+                raise ViewerError('Unknown node kind: {}'.format(kind))
+            append = getattr(self, 'append_' + kind)
+            append(root_path, name, *params, frame=frame)
 
     def set_cloud_data(self, root_path, name, vertices, colors=None,
                        texture_coords=None, texture_image=None):
@@ -328,31 +630,11 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             colors {list} -- optional colors (default: {None})
             texture_coords {list} -- optional texture coordinates (default: {None})
-            texture_image {np.ndarray} -- texture image (default: {None})
+            texture_image {np.ndarray} -- grey, grey-alpha, BGR or BGRA image (default: {None})
         """
-        node = self._groups[root_path].find(name).children[0]
-
-        geom_node = node.node()
-        if geom_node.get_num_geoms() == 0:
-            geom = geometry.make_points(vertices, colors, texture_coords)
-            geom_node.add_geom(geom)
-        else:
-            geom = geom_node.modify_geom(0)
-            geometry.make_points(vertices, colors, texture_coords, geom)
-
-        if texture_image is not None:
-            height, width, _ = texture_image.shape
-            data = texture_image.tostring()
-            texture = node.find_texture('cloud_tex')
-            if texture is None:
-                texture = Texture('cloud_tex')
-                texture.setup_2d_texture(width, height, Texture.T_unsigned_byte, Texture.F_rgb)
-                texture.set_wrap_u(Texture.WM_border_color)
-                texture.set_wrap_v(Texture.WM_border_color)
-                texture.set_ram_image(data)
-                node.set_texture(texture)
-            else:
-                texture.set_ram_image(data)
+        for holder in self._group_nodes[root_path][name]:
+            self._update_cloud(holder.children[0], vertices, colors, texture_coords,
+                               texture_image)
 
     def set_material(self, root_path, name, color=None, texture_path=''):
         """Override material of a node.
@@ -365,24 +647,8 @@ class ViewerApp(ShowBase):
         Keyword Arguments:
             texture {str | np.ndarray} -- path to the texture file on disk  (default: {None})
         """
-        node = self._groups[root_path].find(name)
-
-        if color is not None:
-            node.set_color(Vec4(*color))
-
-            material = Material()
-            material.set_ambient(Vec4(*color))
-            material.set_diffuse(Vec4(*color))
-            material.set_specular(Vec3(1, 1, 1))
-            material.set_roughness(0.4)
-            node.set_material(material, 1)
-
-            if color[3] < 1:
-                node.set_transparency(TransparencyAttrib.M_alpha)
-
-        if texture_path:
-            texture = self.loader.load_texture(texture_path)
-            node.set_texture(texture)
+        self._apply_material(self._group_nodes[root_path][name],
+                             self._group_colors[root_path], name, color, texture_path)
 
     def set_materials(self, root_path, name_material_dict):
         """Override material of nodes within a group.
@@ -391,12 +657,75 @@ class ViewerApp(ShowBase):
             root_path {str} -- path to the group's root node
             name_material_dict {dict} -- {node_name : (color_rgba, texture_path)} dictionary
         """
+        nodes = self._group_nodes[root_path]
+        last_colors = self._group_colors[root_path]
         for name, material in name_material_dict.items():
             if len(material) == 2:
                 color_rgba, texture_path = material
             else:
                 color_rgba, texture_path = material, ''
-            self.set_material(root_path, name, color_rgba, texture_path)
+            self._apply_material(nodes[name], last_colors, name, color_rgba, texture_path)
+
+    def set_materials_bulk(self, root_path, names, colors, texture_paths=None):
+        """Override material of nodes within a group from a colors array.
+
+        Arguments:
+            root_path {str} -- path to the group's root node
+            names {list} -- node names within a group
+            colors {np.ndarray} -- (N, 4) array of colors RGBA
+
+        Keyword Arguments:
+            texture_paths {list} -- paths to the texture files on disk (default: {None})
+        """
+        colors = np.asarray(colors, dtype=np.float32)
+        if colors.shape != (len(names), 4):
+            raise ViewerError('Colors array shape {} does not match {} nodes'.format(
+                colors.shape, len(names)))
+        if texture_paths is None:
+            texture_paths = ('',) * len(names)
+        nodes = self._group_nodes[root_path]
+        last_colors = self._group_colors[root_path]
+        for name, color, texture_path in zip(names, colors.tolist(), texture_paths):
+            self._apply_material(nodes[name], last_colors, name, color, texture_path)
+
+    def _apply_material(self, nodes, last_colors, name, color, texture_path):
+        if color is not None:
+            color = tuple(color)
+            last_color = last_colors.get(name)
+            if color != last_color:
+                last_colors[name] = color
+                color = Vec4(*color)
+
+                # share materials between nodes of the same color
+                key = tuple(color)
+                material = self._materials.get(key)
+                if material is None:
+                    material = Material()
+                    material.set_ambient(color)
+                    material.set_diffuse(color)
+                    material.set_specular(Vec3(1, 1, 1))
+                    material.set_roughness(0.4)
+                    self._materials[key] = material
+
+                # switch blending only when the alpha crosses the opaque threshold
+                translucent = color[3] < 1
+                blending = translucent != (last_color is not None and last_color[3] < 1)
+                for node in nodes:
+                    node.set_color(color)
+                    node.set_material(material, 1)
+                    if blending:
+                        if translucent:
+                            node.set_transparency(TransparencyAttrib.M_alpha)
+                        else:
+                            node.clear_transparency()
+
+        if texture_path:
+            texture = self._textures.get(texture_path)
+            if texture is None:
+                texture = self.loader.load_texture(texture_path)
+                self._textures[texture_path] = texture
+            for node in nodes:
+                node.set_texture(texture)
 
     def reset_camera(self, pos, look_at):
         """Reset camera position.
@@ -409,10 +738,10 @@ class ViewerApp(ShowBase):
         self.camera.look_at(Vec3(*look_at))
 
         if self.windowType == 'onscreen':
-            # update mouse control according to the camera position
-            cam_mat = Mat4(self.camera.get_mat())
-            cam_mat.invert_in_place()
-            self.mouseInterfaceNode.set_mat(cam_mat)
+            # update mouse control according to the camera position,
+            # the trackball reads its own matrix, not the node transform
+            inv_transform = self.camera.get_transform().get_inverse()
+            self.mouseInterfaceNode.set_mat(inv_transform.get_mat())
 
     def enable_lights(self, enable):
         """Turn lighting on or off.
@@ -420,11 +749,15 @@ class ViewerApp(ShowBase):
         Arguments:
             enable {bool} -- flag
         """
-        for light, mask in zip(self._lights, self._lights_mask):
-            if enable and mask:
-                self.render.set_light(light)
-            else:
-                self.render.clear_light(light)
+        # compose the lights state once and apply it in a single change, if any
+        lights = tuple(bool(enable and mask) for mask in self._lights_mask)
+        if lights != self._lights_applied:
+            attrib = LightAttrib.make()
+            for light, on in zip(self._lights, lights):
+                if on:
+                    attrib = attrib.add_on_light(light)
+            self.render.set_attrib(attrib)
+            self._lights_applied = lights
         self._lights_enabled = enable
 
     def enable_light(self, index, enable):
@@ -436,6 +769,9 @@ class ViewerApp(ShowBase):
         """
         self._lights_mask[index] = enable
         self.enable_lights(self._lights_enabled)
+        light = self._lights[index].node()
+        if self._shadow_enabled and not light.is_ambient_light():
+            light.set_shadow_caster(bool(enable))
 
     def enable_shadow(self, enable):
         """Turn shadows rendering on or off.
@@ -443,9 +779,10 @@ class ViewerApp(ShowBase):
         Arguments:
             enable {bool} -- flag
         """
-        for light in self._lights:
+        # disabled lights do not cast shadows, so they get no shadow buffer and pass
+        for light, mask in zip(self._lights, self._lights_mask):
             if not light.node().is_ambient_light():
-                light.node().set_shadow_caster(enable)
+                light.node().set_shadow_caster(enable and mask)
         # self.render.set_depth_offset(1 if enable else 0)
         self._shadow_enabled = enable
 
@@ -467,10 +804,16 @@ class ViewerApp(ShowBase):
         Arguments:
             enable {bool} -- flag
         """
+        enable = bool(enable)
+        if enable == self._fog_enabled:
+            return
         if enable:
+            if self._fog is None:
+                self._fog = self._make_fog()
             self.render.set_fog(self._fog)
         else:
             self.render.clear_fog()
+        self._fog_enabled = enable
 
     def show_axes(self, show):
         """Turn the axes rendering on or off.
@@ -478,10 +821,17 @@ class ViewerApp(ShowBase):
         Arguments:
             show {bool} -- flag
         """
+        # the flag tracks the state, so nodes are touched on changes only
+        show = bool(show)
+        if show == self._axes_shown:
+            return
         if show:
+            if self._axes is None:
+                self._axes = self._make_axes()
             self._axes.show()
         else:
             self._axes.hide()
+        self._axes_shown = show
 
     def show_grid(self, show):
         """Turn the grid rendering on or off.
@@ -489,10 +839,16 @@ class ViewerApp(ShowBase):
         Arguments:
             show {bool} -- flag
         """
+        show = bool(show)
+        if show == self._grid_shown:
+            return
         if show:
+            if self._grid is None:
+                self._grid = self._make_grid()
             self._grid.show()
         else:
             self._grid.hide()
+        self._grid_shown = show
 
     def show_floor(self, show):
         """Turn the floor rendering on or off.
@@ -500,10 +856,16 @@ class ViewerApp(ShowBase):
         Arguments:
             show {bool} -- flag
         """
+        show = bool(show)
+        if show == self._floor_shown:
+            return
         if show:
+            if self._floor is None:
+                self._floor = self._make_floor()
             self._floor.show()
         else:
             self._floor.hide()
+        self._floor_shown = show
 
     def set_background_color(self, color_rgb):
         """Set the window background color.
@@ -518,16 +880,18 @@ class ViewerApp(ShowBase):
         else:
             r, g, b, a = color_rgb
         self.win.set_clear_color(Vec4(r, g, b, a))
-        self._fog.set_color(Vec3(r, g, b))
+        if self._fog is not None:
+            self._fog.set_color(Vec3(r, g, b))
 
-    def save_screenshot(self, filename=None):
+    def save_screenshot(self, filename=None, blocking=True):
         """Capture a screenshot from the main window and write image to disk.
 
         Keyword Arguments:
             filename {str} -- filename (including extension) to save image (default: {auto})
+            blocking {bool} -- wait for the file to be written (default: {True})
 
         Returns:
-            bool -- success flag
+            bool -- success flag, the capture one only if not blocking
         """
         if filename is None:
             template = 'screenshot-%Y-%m-%d-%H-%M-%S.png'
@@ -538,15 +902,22 @@ class ViewerApp(ShowBase):
         if filename.lower().endswith('.png'):
             # remove alpha channel when export to png
             image.remove_alpha()
+        if not blocking:
+            # encode and write in the background while the main loop keeps rendering
+            if self._image_writer is None:
+                self._image_writer = ThreadPoolExecutor(max_workers=1)
+            self._image_writer.submit(image.write, filename)
+            return True
         if not image.write(filename):
             return False
         return True
 
-    def get_screenshot(self, requested_format='BGRA'):
+    def get_screenshot(self, requested_format='BGRA', copy=False):
         """Capture and return a screenshot from offscreen buffer.
 
         Keyword Arguments:
             requested_format {str} -- image channels, e.g. RGB, BGR (default: {'BGRA'})
+            copy {bool} -- return a C-contiguous copy instead of a flipped view (default: {False})
 
         Returns:
             ndarray -- image as uint8 numpy array (height, width, num_channels)
@@ -554,16 +925,108 @@ class ViewerApp(ShowBase):
         texture = self.win.get_screenshot()
         if texture is None:
             return None
-        xsize = texture.get_x_size()
-        ysize = texture.get_y_size()
-        dsize = len(requested_format)
-        image = texture.get_ram_image_as(requested_format)
-        array = np.asarray(image).reshape((ysize, xsize, dsize))
-        return np.flipud(array)
+        array = _texture_image(texture, requested_format)
+        if copy:
+            return np.ascontiguousarray(array)
+        return array
+
+    def get_screenshot_async(self, requested_format='BGRA'):
+        """Request a screenshot of the next rendered frame.
+
+        The frame is copied to RAM as part of its regular rendering,
+        without an extra synchronous readback.
+
+        Keyword Arguments:
+            requested_format {str} -- image channels, e.g. RGB, BGR (default: {'BGRA'})
+
+        Returns:
+            ScreenshotFuture -- pending screenshot
+        """
+        if self._screenshot_texture is None:
+            self._screenshot_texture = Texture('screenshot')
+            self.win.add_render_texture(
+                self._screenshot_texture, GraphicsOutput.RTM_triggered_copy_ram)
+        self.win.trigger_copy()
+        return ScreenshotFuture(self, self._screenshot_texture, requested_format)
+
+    @staticmethod
+    def _set_matrices(nodes, frames):
+        # transpose all the matrices at once to the row-major order of Mat4,
+        # then stream them from one buffer instead of passing 16 floats per matrix
+        rows = np.asarray(frames, dtype='<f4').transpose(0, 2, 1)
+        datagram = Datagram(rows.tobytes())
+        reader = DatagramIterator(datagram)  # does not keep the datagram alive
+        mat = Mat4()
+        for node in nodes:
+            mat.read_datagram_fixed(reader)
+            node.set_mat(mat)
+
+    def _update_cloud(self, node, vertices, colors, texture_coords, texture_image):
+        geom_node = node.node()
+        if geom_node.get_num_geoms() == 0:
+            geom = geometry.make_points(vertices, colors, texture_coords)
+            geom_node.add_geom(geom)
+        else:
+            geom = geom_node.modify_geom(0)
+            geometry.make_points(vertices, colors, texture_coords, geom)
+
+        if texture_image is not None:
+            if texture_image.ndim == 2:
+                texture_image = texture_image[..., None]  # grey
+            height, width, channels = texture_image.shape
+            if channels not in _CLOUD_TEXTURE_FORMATS:
+                raise ViewerError('Unsupported number of texture channels: {}'.format(channels))
+            image_format, texture_format = _CLOUD_TEXTURE_FORMATS[channels]
+            # upload straight from the array buffer, without an intermediate bytes copy
+            data = memoryview(np.ascontiguousarray(texture_image, dtype=np.uint8)).cast('B')
+            texture = node.find_texture('cloud_tex')
+            if texture is None:
+                texture = Texture('cloud_tex')
+                texture.setup_2d_texture(width, height, Texture.T_unsigned_byte, texture_format)
+                texture.set_wrap_u(Texture.WM_border_color)
+                texture.set_wrap_v(Texture.WM_border_color)
+                texture.set_ram_image_as(data, image_format)
+                node.set_texture(texture)
+            else:
+                layout = (texture.get_x_size(), texture.get_y_size(), texture.get_num_components())
+                if layout != (width, height, channels):
+                    texture.setup_2d_texture(
+                        width, height, Texture.T_unsigned_byte, texture_format)
+                texture.set_ram_image_as(data, image_format)
+
+    def _append_primitive(self, root_path, name, key, scale, frame):
+        template = self._templates.get(key)
+        if template is None:
+            # built on first use, then shared by all nodes
+            kind, args = key[0], key[1:]
+            template = _make_template(kind, getattr(geometry, 'make_' + kind)(*args))
+            self._templates[key] = template
+        # the node keeps its own transform, the geometry node is shared
+        node = NodePath(PandaNode(template.name))
+        template.instance_to(node)
+        if scale is not None:
+            node.set_scale(scale)
+        self.append_node(root_path, name, node, frame)
+
+    def _flush_image_writer(self):
+        if self._image_writer is not None:
+            self._image_writer.shutdown(wait=True)
+            self._image_writer = None
+
+    def _load_model(self, mesh_path, no_cache):
+        # synchronous load with the C++ loader, the model pool is consulted unless no_cache
+        flags = LoaderOptions.LF_search | LoaderOptions.LF_report_errors
+        if no_cache:
+            flags |= LoaderOptions.LF_no_cache
+        node = self.loader.loader.load_sync(
+            Filename.from_os_specific(mesh_path), LoaderOptions(flags))
+        if node is None:
+            raise IOError('Could not load model file: {}'.format(mesh_path))
+        return NodePath(node)
 
     def _make_light_ambient(self, color):
         light = AmbientLight('Ambient Light')
-        light.set_color(Vec3(*color))
+        light.set_color(color)
         return self.render.attach_new_node(light)
 
     def _make_light_direct(self, index, color, pos, target=(0, 0, 0)):
@@ -571,7 +1034,7 @@ class ViewerApp(ShowBase):
             light = Spotlight('Spotlight {:02d}'.format(index))
         else:
             light = DirectionalLight('Directional Light{:02d}'.format(index))
-        light.set_color(Vec3(*color))
+        light.set_color(color)
         light.set_camera_mask(self.LightMask)
         light.set_shadow_buffer_size(
             (self._shadow_size, self._shadow_size))
@@ -593,28 +1056,33 @@ class ViewerApp(ShowBase):
     def _make_axes(self):
         model = GeomNode('axes')
         model.add_geom(geometry.make_axes())
-        node = self.render.attach_new_node(model)
+        node = self._helpers.attach_new_node(model)
         node.set_light_off()
         node.set_render_mode_wireframe()
         node.set_render_mode_thickness(4)
-        node.set_antialias(AntialiasAttrib.MLine)
+        if self._cfg['enable-antialias']:
+            node.set_antialias(AntialiasAttrib.MLine)
         node.hide(self.LightMask)
+        self._freeze(node)
         return node
 
     def _make_grid(self):
         model = GeomNode('grid')
         model.add_geom(geometry.make_grid())
-        node = self.render.attach_new_node(model)
+        node = self._helpers.attach_new_node(model)
         node.set_light_off()
         node.set_render_mode_wireframe()
-        node.set_antialias(AntialiasAttrib.MLine)
+        if self._cfg['enable-antialias']:
+            node.set_antialias(AntialiasAttrib.MLine)
         node.hide(self.LightMask)
+        self._freeze(node)
         return node
 
     def _make_floor(self):
         model = GeomNode('floor')
         model.add_geom(geometry.make_plane(size=(10, 10)))
-        node = self.render.attach_new_node(model)
+        model.set_bounds_type(BoundingVolume.BT_box)
+        node = self._helpers.attach_new_node(model)
         node.set_color(Vec4(0.3, 0.3, 0.3, 1))
         material = Material()
         material.set_ambient(Vec4(0, 0, 0, 1))
@@ -622,8 +1090,15 @@ class ViewerApp(ShowBase):
         material.set_specular(Vec3(1, 1, 1))
         material.set_roughness(0.8)
         node.set_material(material, 1)
+        self._freeze(node)
         return node
 
+    @staticmethod
+    def _freeze(node):
+        # static node: merge its subtree and stop the cull traversal at it
+        node.flatten_strong()
+        node.node().set_final(True)
+
     def _toggle_fps(self):
         self.set_frame_rate_meter(self.frameRateMeter is None)
 
@@ -634,58 +1109,48 @@ class ViewerApp(ShowBase):
             self._help_label.removeNode()
             self._help_label = None
 
+    def _toggle_axes(self):
+        self.show_axes(not self._axes_shown)
+
+    def _toggle_hdr(self):
+        self.enable_hdr(not self._hdr_enabled)
+
+    def _toggle_grid(self):
+        self.show_grid(not self._grid_shown)
+
+    def _toggle_lights(self):
+        self.enable_lights(not self._lights_enabled)
+
+    def _toggle_fog(self):
+        self.enable_fog(not self._fog_enabled)
+
+    def _toggle_floor(self):
+        self.show_floor(not self._floor_shown)
+
+    def _toggle_shadow(self):
+        self.enable_shadow(not self._shadow_enabled)
+
     def _setup_shortcuts(self):
-        self.accept('space', self.save_screenshot)
+        self.accept('space', self.save_screenshot, [None, False])
         self.accept('escape', self.stop)
         self.accept('f1', self._toggle_help)
-        self.accept('a', lambda: self.show_axes(self._axes.is_hidden()))
-        self.accept('d', lambda: self.enable_hdr(not self._hdr_enabled))
-        self.accept('g', lambda: self.show_grid(self._grid.is_hidden()))
+        self.accept('a', self._toggle_axes)
+        self.accept('d', self._toggle_hdr)
+        self.accept('g', self._toggle_grid)
         self.accept('h', self._toggle_help)
         self.accept('f', self._toggle_fps)
-        self.accept('l', lambda: self.enable_lights(not self._lights_enabled))
-        self.accept('o', lambda: self.enable_fog(not self.render.has_fog()))
+        self.accept('l', self._toggle_lights)
+        self.accept('o', self._toggle_fog)
         self.accept('q', self.stop)
-        self.accept('p', lambda: self.show_floor(self._floor.is_hidden()))
+        self.accept('p', self._toggle_floor)
         self.accept('r', self.reset_camera, self._camera_defaults)
-        self.accept('s', lambda: self.enable_shadow(not self._shadow_enabled))
+        self.accept('s', self._toggle_shadow)
         self.accept('t', self.toggle_texture)
         self.accept('w', self.toggle_wireframe)
 
     def _make_help_label(self):
 
-        def section(title, items):
-            return '{}:\n'.format(title) + \
-                '\n'.join((' {}:\t{}'.format(h, k) for h, k in items))
-
-        keyboard = (
-            ("Show help", "F1, h"),
-            ("Quit window", "Escape, q"),
-            ("Screenshot", "Space"),
-            ("Toggle axes", "a"),
-            ("Toggle HDR", "d"),
-            ("Toggle grid", "g"),
-            ("Toggle fps meter", "f"),
-            ("Toggle lighting", "l"),
-            ("Toggle fog", "o"),
-            ("Toggle plane", "p"),
-            ("Reset camera", "r"),
-            ("Toggle shadows", "s"),
-            ("Toggle texture", "t"),
-            ("Toggle wireframe", "w"),
-        )
-        mouse = (
-            ("Move", "LMB"),
-            ("Scale", "RMB, Ctrl+LMB"),
-            ("Rotate", "LMB+RMB, Alt+LMB"),
-            ("Tilt", "Alt+Ctrl+LMB")
-        )
-        text = '\n\n'.join((
-            section("Keyboard shortcuts", keyboard),
-            section("Mouse control", mouse)
-        ))
-
-        return OnscreenText(text=text,
+        return OnscreenText(text=_HELP_TEXT,
                             parent=self.a2dTopLeft,
                             align=TextNode.ALeft,
                             style=1,
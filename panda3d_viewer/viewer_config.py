@@ -2,13 +2,19 @@
 
 __all__ = ('ViewerConfig')
 
+# normalized setting names, {key : prc-key}
+_KEYS = {}
+
 
 class ViewerConfig:
     """Viewer configuration."""
 
+    __slots__ = ('_settings_map', '_text')
+
     def __init__(self, **kwargs):
         """Construct an empty configuration and populate from @kwargs."""
-        self._setings_map = {}
+        self._settings_map = {}
+        self._text = None
 
         # disable audio by default
         self.set_value('audio-active', False)
@@ -32,9 +38,10 @@ class ViewerConfig:
         Returns:
             str -- text representation
         """
-        lines = ('{} {}'.format(key, value)
-                 for key, value in self._setings_map.items())
-        return '\n'.join(lines)
+        if self._text is None:
+            settings = self._settings_map
+            self._text = '\n'.join(map('{} {}'.format, settings, settings.values()))
+        return self._text
 
     def set_value(self, key, value):
         """Set common setting value.
@@ -43,10 +50,13 @@ class ViewerConfig:
             key {str} -- setting name
             value {Any} -- setting value
         """
-        key = key.replace('_', '-').lower()
+        prc_key = _KEYS.get(key)
+        if prc_key is None:
+            prc_key = _KEYS[key] = key.replace('_', '-').lower()
         if isinstance(value, bool):
             value = 1 if value else 0
-        self._setings_map[key] = str(value)
+        self._settings_map[prc_key] = str(value)
+        self._text = None
 
     def set_window_type(self, window_type):
         """Set window type.
@@ -98,6 +108,7 @@ class ViewerConfig:
         """
         self.set_value('framebuffer-multisample', enable)
         self.set_value('multisamples', multisamples)
+        self.set_value('enable-antialias', enable)
 
     def enable_lights(self, enable):
         """Enable lightning.
@@ -1,11 +1,145 @@
 """This module contains a viewer application process proxy."""
 
+from contextlib import contextmanager
+from itertools import chain
 import multiprocessing as mp
+import os
+import pickle
+import selectors
+import struct
+import sys
+import weakref
 
-from .viewer_errors import ViewerClosedError
+import numpy as np
+
+from .viewer_errors import ViewerClosedError, ViewerError
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# POSIX blocks outlive their handles and are tracked, Windows frees them with the last handle
+_TRACK_SHARED = os.name == 'posix'
 
 __all__ = ('ViewerAppProxy')
 
+# arrays larger than this are passed through shared memory instead of the pipe
+_SHARED_MIN_BYTES = 1 << 16
+# alignment of arrays packed together into one shared memory block
+_SHARED_ALIGN = 64
+
+
+class _SharedArray:
+    """A reference to an array placed in a shared memory block."""
+
+    def __init__(self, name, shape, dtype, offset=0):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.offset = offset
+
+
+def _is_large_array(value):
+    if not isinstance(value, np.ndarray):
+        return False
+    return value.nbytes >= _SHARED_MIN_BYTES and not value.dtype.hasobject
+
+
+def _has_shared_args(args, kwargs):
+    return any(isinstance(value, _SharedArray) for value in chain(args, kwargs.values()))
+
+
+def _aligned_size(nbytes):
+    return -(-nbytes // _SHARED_ALIGN) * _SHARED_ALIGN
+
+
+def _unlink_shared(shm, pid):
+    shm.close()
+    if os.getpid() == pid:
+        # not in a forked sub-process collecting a copy of the host proxy
+        shm.unlink()
+
+
+# hot methods are sent as tagged binary messages instead of pickles, the tags
+# stay below 0x80 - the PROTO opcode every pickled message starts with
+_TAG_STEP = 0x01
+_TAG_MOVE_NODES_BULK = 0x02
+_TAG_RESET_CAMERA = 0x03
+
+# tag, root path length, node names length
+_NAMES_HEADER = struct.Struct('=BHI')
+# tag, camera position, target point
+_CAMERA = struct.Struct('=B6d')
+
+
+def _encode_step(args, kwargs):
+    if args or kwargs:
+        return None
+    return bytes((_TAG_STEP,))
+
+
+def _encode_move_nodes_bulk(args, kwargs):
+    if len(args) != 3 or kwargs or not len(args[1]):
+        return None
+    root_path, names, poses = args
+    poses = np.ascontiguousarray(poses, dtype=np.float32)
+    if poses.shape not in ((len(names), 7), (len(names), 4, 4)):
+        return None  # let the application report the error
+    if poses.nbytes >= _SHARED_MIN_BYTES:
+        return None  # passed through shared memory
+    root_path = root_path.encode()
+    names = '\0'.join(names).encode()
+    try:
+        header = _NAMES_HEADER.pack(_TAG_MOVE_NODES_BULK, len(root_path), len(names))
+    except struct.error:
+        return None  # too long to fit the header
+    return b''.join((header, root_path, names, poses.tobytes()))
+
+
+def _encode_reset_camera(args, kwargs):
+    if len(args) != 2 or kwargs:
+        return None
+    pos, look_at = args
+    try:
+        return _CAMERA.pack(_TAG_RESET_CAMERA, *pos, *look_at)
+    except (TypeError, struct.error):
+        return None  # let the application report the error
+
+
+# name of a message carrying a list of (name, args, kwargs) calls
+_BATCH = '__batch__'
+
+_ENCODERS = {
+    'step': _encode_step,
+    'move_nodes_bulk': _encode_move_nodes_bulk,
+    'reset_camera': _encode_reset_camera,
+}
+
+
+def _recv_call(conn):
+    """Receive a method call as (name, args, kwargs) in either encoding."""
+    payload = conn.recv_bytes()
+    tag = payload[0]
+    if tag >= 0x80:
+        return pickle.loads(payload)
+    if tag == _TAG_STEP:
+        return 'step', (), {}
+    if tag == _TAG_RESET_CAMERA:
+        values = _CAMERA.unpack(payload)
+        return 'reset_camera', (values[1:4], values[4:]), {}
+    _, root_len, names_len = _NAMES_HEADER.unpack_from(payload)
+    start = _NAMES_HEADER.size
+    root_path = payload[start:start + root_len].decode()
+    start += root_len
+    names = payload[start:start + names_len].decode().split('\0')
+    start += names_len
+    # (N, 7) or (N, 4, 4) poses, told apart by the row size
+    poses = np.frombuffer(payload, dtype=np.float32, offset=start).reshape(len(names), -1)
+    if poses.shape[1] == 16:
+        poses = poses.reshape(-1, 4, 4)
+    return 'move_nodes_bulk', (root_path, names, poses), {}
+
 
 class ViewerAppProxy(mp.Process):
     """A viewer application process proxy.
@@ -20,11 +154,21 @@ class ViewerAppProxy(mp.Process):
         self._args = args
         self._kwargs = kwargs
         self._host_conn, self._proc_conn = mp.Pipe()
+        self._shm = None
+        self._shm_finalizer = None
+        self._args_shm = None
+        self._args_shm_finalizer = None
+        self._batch = None
+        self._batch_replies = None
         self.daemon = True
+        if shared_memory is not None and _TRACK_SHARED:
+            # start the resource tracker first to share it with the sub-process,
+            # so blocks attached on both sides are registered only once
+            resource_tracker.ensure_running()
         self.start()
-        reply = self._host_conn.recv()
-        if isinstance(reply, Exception):
-            raise reply
+        # only the sub-process keeps its end open, so the host gets EOF once it exits
+        self._proc_conn.close()
+        self._recv()
 
     def __getattr__(self, name):
         """Redirect method calls to the sub-process.
@@ -35,37 +179,220 @@ class ViewerAppProxy(mp.Process):
         Returns:
             callable -- an application method wrapper
         """
+        if name.startswith('_'):
+            # private and special attributes are never application methods
+            raise AttributeError(name)
+        encoder = _ENCODERS.get(name)
+
         def _send(*args, **kwargs):
-            self._host_conn.send((name, args, kwargs))
-            reply = self._host_conn.recv()
-            if isinstance(reply, Exception):
-                raise reply
+            if self._batch is not None:
+                if name == 'step':
+                    raise ViewerError('Rendering can not be requested within a batch')
+                self._batch.append((name, args, kwargs))
+                return None
+            payload = encoder(args, kwargs) if encoder is not None else None
+            try:
+                if payload is not None:
+                    self._host_conn.send_bytes(payload)
+                else:
+                    if shared_memory is not None:
+                        args, kwargs = self._write_shared_args(args, kwargs)
+                    self._host_conn.send((name, args, kwargs))
+            except OSError:  # a broken pipe or a reset connection
+                raise ViewerClosedError('The viewer process has exited')
+            reply = self._recv()
+            if isinstance(reply, _SharedArray):
+                reply = self._read_shared(reply)
             return reply
 
+        # the next lookups find the wrapper in the instance dictionary
+        self.__dict__[name] = _send
         return _send
 
+    @contextmanager
+    def batch(self):
+        """Collect method calls made within a with-block and send them at once.
+
+        Calls return None, the yielded list is filled with their replies on exit.
+        A failed call stops the batch, the calls after it are not run,
+        and a ViewerError naming it is raised on exit.
+
+        Yields:
+            list -- replies of the calls, in the call order
+        """
+        if self._batch is not None:
+            yield self._batch_replies  # nested
+            return
+        self._batch = []
+        self._batch_replies = replies = []
+        try:
+            yield replies
+            calls = self._batch
+        finally:
+            self._batch = None
+            self._batch_replies = None
+        if calls:
+            try:
+                self._host_conn.send((_BATCH, (calls,), {}))
+            except OSError:  # a broken pipe or a reset connection
+                raise ViewerClosedError('The viewer process has exited')
+            replies.extend(self._recv())
+
+    def _recv(self):
+        """Receive a reply from the sub-process, raise it if it is an error."""
+        try:
+            reply = self._host_conn.recv()
+        except (EOFError, OSError):
+            raise ViewerClosedError('The viewer process has exited')
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def _read_shared(self, ref):
+        """Copy an array out of a shared memory block written by the sub-process."""
+        if self._shm is None or self._shm.name != ref.name:
+            # the host owns the blocks, so they are released even if the sub-process dies
+            self._free_shared(unlink=True)
+            self._shm = shared_memory.SharedMemory(ref.name)
+            self._shm_finalizer = weakref.finalize(self, _unlink_shared, self._shm, os.getpid())
+        view = np.ndarray(ref.shape, ref.dtype, buffer=self._shm.buf)
+        array = view.copy()
+        del view
+        return array
+
+    def _write_shared_args(self, args, kwargs):
+        """Place large array arguments into a shared memory block owned by the host."""
+        large = [value for value in chain(args, kwargs.values()) if _is_large_array(value)]
+        if not large:
+            return args, kwargs
+        size = sum(_aligned_size(array.nbytes) for array in large)
+        if self._args_shm is None or self._args_shm.size < size:
+            if self._args_shm is not None:
+                self._args_shm_finalizer()
+            self._args_shm = shared_memory.SharedMemory(create=True, size=size)
+            self._args_shm_finalizer = weakref.finalize(
+                self, _unlink_shared, self._args_shm, os.getpid())
+        offset = 0
+
+        def _share(value):
+            nonlocal offset
+            if not _is_large_array(value):
+                return value
+            view = np.ndarray(value.shape, value.dtype, buffer=self._args_shm.buf, offset=offset)
+            view[...] = value
+            del view
+            ref = _SharedArray(self._args_shm.name, value.shape, value.dtype.str, offset)
+            offset += _aligned_size(value.nbytes)
+            return ref
+
+        return tuple(map(_share, args)), {key: _share(value) for key, value in kwargs.items()}
+
+    def _read_shared_args(self, args, kwargs):
+        """Copy large array arguments out of the shared memory block written by the host."""
+        if not _has_shared_args(args, kwargs):
+            return args, kwargs
+
+        def _copy(value):
+            if not isinstance(value, _SharedArray):
+                return value
+            if self._args_shm is None or self._args_shm.name != value.name:
+                if self._args_shm is not None:
+                    self._args_shm.close()
+                self._args_shm = shared_memory.SharedMemory(value.name)
+            view = np.ndarray(value.shape, value.dtype, buffer=self._args_shm.buf,
+                              offset=value.offset)
+            array = view.copy()
+            del view
+            return array
+
+        return tuple(map(_copy, args)), {key: _copy(value) for key, value in kwargs.items()}
+
+    def _write_shared(self, array):
+        """Place a large array into a shared memory block, grow it if needed."""
+        if shared_memory is None or not _is_large_array(array):
+            return array
+        if self._shm is None or self._shm.size < array.nbytes:
+            self._free_shared(unlink=False)
+            self._shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+            if _TRACK_SHARED:
+                # ownership goes to the host process, see _read_shared
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        view = np.ndarray(array.shape, array.dtype, buffer=self._shm.buf)
+        view[...] = array
+        del view
+        return _SharedArray(self._shm.name, array.shape, array.dtype.str)
+
+    def _free_shared(self, unlink):
+        if self._shm is not None:
+            if unlink:
+                self._shm_finalizer()
+            else:
+                self._shm.close()
+            self._shm = None
+
+    def _create_app(self):
+        """Create the application, called in the sub-process."""
+        # import here to prevent Panda3D from loading in the host process
+        from .viewer_app import ViewerApp
+
+        return ViewerApp(*self._args, **self._kwargs)
+
     def run(self):
         """Run the application in a sub-process."""
+        # the host end is left to the host process
+        self._host_conn.close()
+        selector = None
         try:
-            # import here to prevent Panda3D from loading in the host process
-            from .viewer_app import ViewerApp
-
-            app = ViewerApp(*self._args, **self._kwargs)
+            app = self._create_app()
             self._proc_conn.send(None)
 
+            # bound application methods, {name : method}
+            methods = {}
+
+            def _method(name):
+                method = methods.get(name)
+                if method is None:
+                    method = methods[name] = getattr(app, name)
+                return method
+
+            def _run_batch(calls):
+                replies = []
+                for index, (name, args, kwargs) in enumerate(calls):
+                    try:
+                        replies.append(_method(name)(*args, **kwargs))
+                    except Exception as error:
+                        return ViewerError(
+                            'Call {} of the batch, {}(), failed and the calls after it '
+                            'were not run: {!r}'.format(index, name, error))
+                return replies
+
+            if sys.platform == 'win32':
+                _poll = self._proc_conn.poll
+            else:
+                # a persistent epoll/poll selector, Connection.poll builds one per call
+                selector = selectors.DefaultSelector()
+                selector.register(self._proc_conn, selectors.EVENT_READ)
+
+                def _poll(timeout):
+                    return bool(selector.select(timeout))
+
             def _execute(task):
                 for _ in range(100):
-                    if not self._proc_conn.poll(0.001):
+                    if not _poll(0.001):
                         break
-                    name, args, kwargs = self._proc_conn.recv()
+                    name, args, kwargs = _recv_call(self._proc_conn)
                     if name == 'step':
                         self._proc_conn.send(None)
                         break  # let the manager to execute other tasks
                     try:
-                        reply = getattr(app, name)(*args, **kwargs)
-                        self._proc_conn.send(reply)
+                        if name == _BATCH:
+                            reply = _run_batch(*args)
+                        else:
+                            args, kwargs = self._read_shared_args(args, kwargs)
+                            reply = self._write_shared(_method(name)(*args, **kwargs))
                     except Exception as error:
-                        self._proc_conn.send(error)
+                        reply = error
+                    self._proc_conn.send(reply)
                 return task.cont
 
             app.task_mgr.add(_execute, "Communication task", -50)
@@ -75,6 +402,11 @@ class ViewerAppProxy(mp.Process):
         else:
             self._proc_conn.send(ViewerClosedError(
                 'User closed the main window'))
+        if selector is not None:
+            selector.close()
+        self._free_shared(unlink=False)
+        if self._args_shm is not None:
+            self._args_shm.close()
         # read the rest to prevent the host process from being blocked
         if self._proc_conn.poll(0.05):
-            self._proc_conn.recv()
+            self._proc_conn.recv_bytes()
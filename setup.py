@@ -2,7 +2,6 @@
 
 from setuptools import setup, find_packages
 from os import path
-from io import open  # for python 2.7
 
 
 here = path.abspath(path.dirname(__file__))
@@ -27,8 +26,8 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: POSIX :: Linux',
         'Operating System :: MacOS :: MacOS X',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
@@ -37,6 +36,7 @@ setup(
     ],
     keywords='rendering graphics 3d visualization',
     packages=find_packages(),
+    python_requires='>=3.6',
     install_requires=['numpy', 'panda3d>=1.10'],
     include_package_data=True,
 )
@@ -0,0 +1,32 @@
+"""Test geometry helpers."""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from panda3d_viewer import geometry
+
+
+def test_primitives_accept_sequences():
+    plane = geometry.make_plane(size=(10, 10))
+    assert geometry.make_plane(size=[10, 10]) is plane
+    assert geometry.make_plane(size=np.array([10.0, 10.0])) is plane
+    assert geometry.make_capsule(np.float32(0.5), 1) is geometry.make_capsule(0.5, 1.0)
+    assert geometry.make_cylinder(np.int64(8)) is geometry.make_cylinder(8)
+
+
+def test_numba_is_loaded_on_demand():
+    # the optional kernel is imported only for capsules large enough to use it
+    root = os.path.dirname(os.path.dirname(os.path.abspath(geometry.__file__)))
+    code = ('import sys; sys.path.insert(0, {!r}); from panda3d_viewer import geometry; '
+            'geometry.make_capsule(0.5, 1.0, 16, 16); '
+            'sys.exit("numba" in sys.modules)').format(root)
+    assert subprocess.call([sys.executable, '-c', code]) == 0
+
+
+def test_degenerate_capsules():
+    # a single ring or segment can not be handled by the kernel
+    assert geometry.make_capsule(0.5, 1.0, 1, 2048).get_num_primitives() == 1
+    assert geometry.make_capsule(0.5, 1.0, 2048, 1).get_num_primitives() == 1
@@ -1,7 +1,19 @@
 """Test module import."""
 
+import os
+import subprocess
+import sys
+
 import panda3d_viewer
 
 
 def test_import():
     assert panda3d_viewer.__version__
+
+
+def test_import_does_not_load_panda3d():
+    # Panda3D is loaded only when an application is created
+    root = os.path.dirname(os.path.dirname(os.path.abspath(panda3d_viewer.__file__)))
+    code = ('import sys; sys.path.insert(0, {!r}); import panda3d_viewer; '
+            'sys.exit("panda3d.core" in sys.modules)').format(root)
+    assert subprocess.call([sys.executable, '-c', code]) == 0
@@ -0,0 +1,169 @@
+"""Test the viewer application process proxy."""
+
+from contextlib import suppress
+
+import numpy as np
+import pytest
+
+from panda3d_viewer import ViewerClosedError, ViewerError
+from panda3d_viewer import viewer_proxy
+from panda3d_viewer.viewer_proxy import ViewerAppProxy
+
+
+class _Conn:
+    """A connection end holding one message."""
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def recv_bytes(self):
+        return self._payload
+
+
+def _round_trip(name, *args):
+    payload = viewer_proxy._ENCODERS[name](args, {})
+    assert payload is not None and payload[0] < 0x80
+    return viewer_proxy._recv_call(_Conn(payload))
+
+
+class _Task:
+    cont = 'cont'
+
+
+class _StubApp:
+    """An application keeping groups in a dictionary."""
+
+    def __init__(self):
+        self.task_mgr = self
+        self._groups = {}
+        self._task = None
+        self._running = True
+
+    def add(self, task, name, sort):
+        self._task = task
+
+    def run(self):
+        while self._running:
+            self._task(_Task())
+
+    def stop(self):
+        self._running = False
+
+    def append_group(self, root_path):
+        self._groups[root_path] = True
+
+    def show_group(self, root_path, show):
+        if root_path not in self._groups:
+            raise ViewerError('Unknown group: {}'.format(root_path))
+        self._groups[root_path] = show
+
+    def get_groups(self):
+        return self._groups
+
+    def get_range(self, size):
+        return np.arange(size, dtype=np.float32)
+
+    def get_sum(self, array):
+        return float(array.sum())
+
+
+class _StubAppProxy(ViewerAppProxy):
+
+    def _create_app(self):
+        return _StubApp()
+
+
+@pytest.fixture
+def proxy():
+    app = _StubAppProxy()
+    yield app
+    with suppress(ViewerClosedError):
+        app.stop()
+    app.join(5)
+
+
+def test_step_round_trip():
+    assert _round_trip('step') == ('step', (), {})
+
+
+def test_move_nodes_bulk_round_trip():
+    names = ['a', 'b', 'c']
+    for poses in (np.random.rand(3, 7), np.random.rand(3, 4, 4)):
+        name, (root_path, names_, poses_), kwargs = _round_trip(
+            'move_nodes_bulk', 'root', names, poses)
+        assert (name, root_path, names_, kwargs) == ('move_nodes_bulk', 'root', names, {})
+        assert np.array_equal(poses_, poses.astype(np.float32))
+
+
+def test_move_nodes_bulk_fallbacks():
+    encode = viewer_proxy._encode_move_nodes_bulk
+    assert encode(('root', ['a'], np.zeros((2, 7))), {}) is None
+    assert encode(('x' * 0x10000, ['a'], np.zeros((1, 7))), {}) is None
+
+
+def test_reset_camera_round_trip():
+    pos, look_at = (1.0, 2.0, 3.0), (4.0, 5.0, 6.0)
+    assert _round_trip('reset_camera', pos, look_at) == ('reset_camera', (pos, look_at), {})
+    assert viewer_proxy._encode_reset_camera(((1, 2), look_at), {}) is None
+
+
+def test_shared_arguments(proxy):
+    array = np.random.rand(viewer_proxy._SHARED_MIN_BYTES // 8 + 1)
+    args, kwargs = proxy._write_shared_args((array, 1), {'key': array[::-1].copy()})
+    assert isinstance(args[0], viewer_proxy._SharedArray)
+    assert args[1] == 1 and kwargs['key'].offset % viewer_proxy._SHARED_ALIGN == 0
+    args, kwargs = proxy._read_shared_args(args, kwargs)
+    assert np.array_equal(args[0], array) and np.array_equal(kwargs['key'], array[::-1])
+    assert np.isclose(proxy.get_sum(array), array.sum())
+
+
+def test_shared_reply(proxy):
+    size = viewer_proxy._SHARED_MIN_BYTES
+    assert np.array_equal(proxy.get_range(size), np.arange(size))
+    assert np.array_equal(proxy.get_range(size * 2), np.arange(size * 2))
+    assert np.array_equal(proxy.get_range(3), np.arange(3))
+
+
+def test_batch_replies(proxy):
+    with proxy.batch() as replies:
+        assert proxy.append_group('a') is None
+        with proxy.batch() as nested:
+            proxy.get_groups()
+        assert nested is replies
+        proxy.get_range(3)
+    assert replies[:2] == [None, {'a': True}]
+    assert np.array_equal(replies[2], np.arange(3))
+
+
+def test_batch_error(proxy):
+    with pytest.raises(ViewerError, match=r'Call 1 of the batch, show_group\(\), failed'):
+        with proxy.batch() as replies:
+            proxy.append_group('a')
+            proxy.show_group('b', False)
+            proxy.append_group('c')
+    assert replies == []
+    # the calls are executed up to the failed one
+    assert proxy.get_groups() == {'a': True}
+
+
+def test_setter_error(proxy):
+    # a setter raises its own error, the next call is run
+    proxy.append_group('a')
+    with pytest.raises(ViewerError, match='Unknown group: b'):
+        proxy.show_group('b', False)
+    proxy.step()
+    proxy.append_group('c')
+    assert proxy.get_groups() == {'a': True, 'c': True}
+
+
+def test_closed_viewer(proxy):
+    proxy.append_group('a')
+    proxy.stop()
+    # calls received before the application loop exits are still run
+    with pytest.raises(ViewerClosedError):
+        for _ in range(10000):
+            proxy.show_group('a', True)
+    with pytest.raises(ViewerClosedError):
+        proxy.show_group('a', True)
+    with pytest.raises(ViewerClosedError):
+        proxy.get_groups()
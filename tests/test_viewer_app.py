@@ -0,0 +1,81 @@
+"""Test the viewer application."""
+
+import os
+
+import numpy as np
+import panda3d
+import pytest
+
+from panda3d_viewer import ViewerConfig, ViewerError
+from panda3d_viewer.viewer_app import ViewerApp
+
+
+@pytest.fixture(scope='module')
+def app():
+    config = ViewerConfig(load_display='p3tinydisplay', win_size=(160, 120))
+    config.set_value('window-type', 'offscreen')
+    app = ViewerApp(config)
+    yield app
+    app.destroy()
+
+
+def _children(app, root_path, name):
+    return [node for node in app._groups[root_path].get_children() if node.name == name]
+
+
+def test_duplicate_names(app):
+    app.append_group('dup')
+    app.append_box('dup', 'box', (1, 1, 1))
+    app.move_nodes('dup', {'box': ((1, 2, 3), (1, 0, 0, 0))})
+    app.set_material('dup', 'box', (1, 0, 0, 1))
+    # a node appended with a taken name gets the next pose and color as well
+    app.append_box('dup', 'box', (1, 1, 1))
+    app.move_nodes('dup', {'box': ((1, 2, 3), (1, 0, 0, 0))})
+    app.set_material('dup', 'box', (1, 0, 0, 1))
+    boxes = _children(app, 'dup', 'box')
+    assert len(boxes) == 2
+    for box in boxes:
+        assert box.get_pos() == (1, 2, 3)
+        assert box.get_color() == (1, 0, 0, 1)
+
+    app.move_nodes_bulk('dup', ['box'], np.array([[4, 5, 6, 1, 0, 0, 0]]))
+    assert [box.get_pos() for box in boxes] == [(4, 5, 6)] * 2
+    app.move_nodes_bulk('dup', ['box'], np.eye(4)[None])
+    assert [box.get_pos() for box in boxes] == [(0, 0, 0)] * 2
+
+    app.append_cloud('dup', 'cloud')
+    app.append_cloud('dup', 'cloud')
+    app.set_cloud_data('dup', 'cloud', np.zeros((5, 3), np.float32))
+    for cloud in _children(app, 'dup', 'cloud'):
+        assert cloud.children[0].node().get_geom(0).get_vertex_data().get_num_rows() == 5
+    app.remove_group('dup')
+
+
+def test_meshes_are_released(app):
+    mesh_path = os.path.join(os.path.dirname(panda3d.__file__), 'models', 'box.egg.pz')
+    app.append_group('a')
+    app.append_group('b')
+    app.append_mesh('a', 'mesh', mesh_path)
+    app.append_mesh('b', 'mesh', mesh_path)
+    app.remove_group('a')
+    assert mesh_path in app._meshes
+    app.remove_group('b')
+    assert mesh_path not in app._meshes
+
+
+def test_cloud_texture_channels(app):
+    app.append_group('cloud')
+    app.append_cloud('cloud', 'cloud')
+    vertices = np.zeros((4, 3), np.float32)
+    coords = np.zeros((4, 2), np.float32)
+    for shape in ((2, 3), (2, 3, 1), (2, 3, 2), (2, 3, 3), (2, 3, 4)):
+        image = np.arange(np.prod(shape), dtype=np.uint8).reshape(shape)
+        app.set_cloud_data('cloud', 'cloud', vertices, texture_coords=coords,
+                           texture_image=image)
+        texture = _children(app, 'cloud', 'cloud')[0].find_texture('cloud_tex')
+        assert texture.get_num_components() == (shape + (1,))[2]
+        assert bytes(texture.get_ram_image()) == image.tobytes()
+    with pytest.raises(ViewerError):
+        app.set_cloud_data('cloud', 'cloud', vertices, texture_coords=coords,
+                           texture_image=np.zeros((2, 3, 5), np.uint8))
+    app.remove_group('cloud')